@@ -1,11 +1,18 @@
+import csv
+import json
+import os
 import random
+import re
 import time
 import pandas as pd
+from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import TimeoutException
 import undetected_chromedriver as uc
 
 
@@ -92,12 +99,68 @@ def dynamic_scroll(driver, target_count=50, max_attempts=1000):
 
 
 
+# 页面内的加载观察器：滚动一屏后用MutationObserver等待记录渲染，
+# 达到目标条数、内容稳定（settle_ms内无DOM变化且无加载条）或超时即回调，每次检查只需一次往返
+SCROLL_WATCH_SCRIPT = """
+const [target, settleMs, maxWaitMs] = arguments;
+const done = arguments[arguments.length - 1];
+const count = () => document.querySelectorAll('div.summary-record').length;
+const loading = () => !!document.querySelector('div.loading-bar');
+const atBottom = () => window.pageYOffset + window.innerHeight >= document.body.scrollHeight - 100;
+
+let finished = false, settleTimer = null, maxTimer = null, observer = null;
+const finish = reason => {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(settleTimer);
+    clearTimeout(maxTimer);
+    done({count: count(), reason: reason, atBottom: atBottom()});
+};
+if (count() >= target) {
+    finish('target');
+    return;
+}
+const armSettle = () => {
+    clearTimeout(settleTimer);
+    settleTimer = setTimeout(() => loading() ? armSettle() : finish('settled'), settleMs);
+};
+observer = new MutationObserver(() => count() >= target ? finish('target') : armSettle());
+observer.observe(document.body, {childList: true, subtree: true});
+maxTimer = setTimeout(() => finish('timeout'), maxWaitMs);
+armSettle();
+window.scrollBy({top: Math.max(window.innerHeight * 0.9, 600), behavior: 'auto'});
+"""
+
+
+def observe_scroll(driver, target_count=50, settle_ms=800, check_timeout=10, max_checks=200):
+    """事件驱动的加载：由页面内观察器报告记录渲染情况，不做固定/随机等待
+
+    达到目标条数返回True；滚到底部且连续两次稳定检查条数不变时结束
+    """
+    driver.set_script_timeout(check_timeout + 5)
+    last_count = -1
+    for _ in range(max_checks):
+        state = driver.execute_async_script(SCROLL_WATCH_SCRIPT, target_count, settle_ms, check_timeout * 1000)
+        if state['count'] >= target_count:
+            print(f"✅ 达到目标记录数 {state['count']}/{target_count}")
+            return True
+        if state['atBottom'] and state['reason'] == 'settled' and state['count'] == last_count:
+            print(f"🔚 页面已加载完毕，共 {state['count']} 条记录")
+            return state['count'] > 0
+        last_count = state['count']
+    print(f"⚠️ 达到最大检查次数，当前 {last_count} 条记录")
+    return False
+
+
 def extract_article_data(start_page, article, idx, current_page, target_count):
     """改进的摘要提取方法"""
     data = {}
     try:
-        data['Title'] = article.find_element(
-            By.CSS_SELECTOR, 'a.title').text.strip()
+        title_link = article.find_element(By.CSS_SELECTOR, 'a.title')
+        data['Title'] = title_link.text.strip()
+        href = title_link.get_attribute('href') or ''
+        data['RecordId'] = href.split('?')[0].split('/')[-1] or None
     except:
         data['Title'] = None
 
@@ -118,11 +181,11 @@ def extract_article_data(start_page, article, idx, current_page, target_count):
         abstract_btn = article.find_element(
             By.CSS_SELECTOR, 'button.show-more')
         abstract_btn.click()
-        time.sleep(0.5)
-        # 使用动态生成的摘要ID
-        abstract_id = f"rec{(start_page+current_page-2) * target_count + idx + 1}AbstractPart0"  # 索引从1开始
-        data['Abstract'] = article.find_element(
-            By.ID, abstract_id).text.strip()
+        # 在本条记录内等待摘要节点出现，不依赖按页码推算的全局ID
+        abstract = WebDriverWait(article, 5, poll_frequency=0.1).until(
+            lambda a: a.find_element(By.CSS_SELECTOR, ABSTRACT_SELECTOR)
+        )
+        data['Abstract'] = abstract.text.strip()
     except Exception as e:
         print(f"摘要提取失败: {str(e)}")
         data['Abstract'] = None
@@ -130,67 +193,562 @@ def extract_article_data(start_page, article, idx, current_page, target_count):
     return data
 
 
-def main(start_page, pages_num, target_count):
+# 摘要节点的选择器（相对于单条记录）
+ABSTRACT_SELECTOR = '[id^="rec"][id*="AbstractPart0"]'
+
+# 单次往返提取整页记录：在页面内遍历所有 div.summary-record，返回JSON数组
+# 选择器与 extract_article_data 保持一致；摘要按记录内的节点查找，不依赖全局编号
+EXTRACT_PAGE_SCRIPT = """
+const text = (root, selector) => {
+    const el = root.querySelector(selector);
+    return el ? el.innerText.trim() : null;
+};
+const records = Array.from(document.querySelectorAll('div.summary-record'));
+return JSON.stringify(records.map(record => ({
+    RecordId: (() => {
+        const link = record.querySelector('a.title');
+        const href = link ? (link.getAttribute('href') || '') : '';
+        return href ? href.split('?')[0].split('/').pop() : null;
+    })(),
+    Title: text(record, 'a.title'),
+    Date: text(record, 'div > div > div.data-section > div:nth-child(2) > div.jcr-and-pub-info-section > span.value.ng-star-inserted'),
+    Citation: text(record, 'div > div > div.stats-container > div > div.stats-section-section > div.no-bottom-border.citations.ng-star-inserted > a'),
+    Abstract: text(record, '%s')
+})));
+""" % ABSTRACT_SELECTOR
+
+# 一次性点击本页所有“展开摘要”按钮，并标记等待摘要出现的记录，返回点击数量
+EXPAND_ABSTRACTS_SCRIPT = """
+let clicked = 0;
+document.querySelectorAll('div.summary-record').forEach(record => {
+    const button = record.querySelector('button.show-more');
+    if (button && !record.querySelector('%s')) {
+        record.dataset.abstractPending = '1';
+        button.click();
+        clicked++;
+    }
+});
+return clicked;
+""" % ABSTRACT_SELECTOR
+
+# 所有被展开的记录都已渲染出摘要节点时返回true
+ABSTRACTS_READY_SCRIPT = """
+return Array.from(document.querySelectorAll('div.summary-record[data-abstract-pending]'))
+    .every(record => record.querySelector('%s'));
+""" % ABSTRACT_SELECTOR
+
+
+def expand_abstracts(driver, timeout=10):
+    """一次展开本页全部摘要，并等待“所有摘要节点出现”而不是固定休眠"""
+    expanded = driver.execute_script(EXPAND_ABSTRACTS_SCRIPT)
+    if not expanded:
+        return True
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script(ABSTRACTS_READY_SCRIPT)
+        )
+        return True
+    except TimeoutException:
+        print(f"⚠️ 部分摘要在 {timeout}s 内未展开，按已加载内容提取")
+        return False
+
+
+def capture_page(driver, page, snapshot_dir="wos_snapshots"):
+    """只保存渲染后的结果页HTML快照（摘要已展开），解析留给离线的 parse_snapshots()"""
+    expand_abstracts(driver)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"page_{page:05d}.html")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(driver.page_source)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _snapshot_text(root, selector):
+    element = root.select_one(selector)
+    return ' '.join(element.get_text(' ').split()) if element else None
+
+
+def parse_snapshot(path):
+    """解析单个页面快照，返回与 extract_page_data 相同列的字典列表"""
+    page = int(re.search(r'(\d+)', os.path.basename(path)).group(1))
+    with open(path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    try:
+        soup = BeautifulSoup(html, 'lxml')
+    except Exception:  # 未安装lxml时使用内置解析器
+        soup = BeautifulSoup(html, 'html.parser')
+
+    items = []
+    for record in soup.select('div.summary-record'):
+        link = record.select_one('a.title')
+        href = link.get('href', '') if link else ''
+        items.append({
+            'RecordId': href.split('?')[0].split('/')[-1] or None,
+            'Title': _snapshot_text(record, 'a.title'),
+            'Date': _snapshot_text(record, 'div > div > div.data-section > div:nth-child(2) > div.jcr-and-pub-info-section > span.value.ng-star-inserted'),
+            'Citation': _snapshot_text(record, 'div > div > div.stats-container > div > div.stats-section-section > div.no-bottom-border.citations.ng-star-inserted > a'),
+            'Abstract': _snapshot_text(record, ABSTRACT_SELECTOR),
+            'Page': page,
+        })
+    return items
+
+
+def parse_snapshots(snapshot_dir="wos_snapshots", output="wos_results.csv", workers=None):
+    """离线并行解析快照目录，按页码顺序写出 Title/Date/Citation/Abstract/Page，重复记录只保留一次"""
+    paths = sorted(
+        os.path.join(snapshot_dir, name) for name in os.listdir(snapshot_dir)
+        if name.startswith('page_') and name.endswith('.html')
+    )
+    writer = ResultWriter(output)
+    seen = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, items in zip(paths, executor.map(parse_snapshot, paths, chunksize=4)):
+                fresh = []
+                for item in items:
+                    key = record_key(item)
+                    if key and key in seen:
+                        continue
+                    if key:
+                        seen.add(key)
+                    fresh.append(item)
+                writer.write_rows(fresh)
+                print(f"已解析 {os.path.basename(path)}: {len(fresh)} 条")
+    finally:
+        writer.close()
+    print(f"解析完成，共 {len(paths)} 页 {writer.count} 条记录")
+    return writer.count
+
+
+def extract_page_data(driver):
+    """用一次 execute_script 提取整页记录，返回与 extract_article_data 相同列的字典列表"""
+    expand_abstracts(driver)
+    return json.loads(driver.execute_script(EXTRACT_PAGE_SCRIPT))
+
+
+class ResultWriter:
+    """逐页追加写入采集结果，内存占用不随记录数增长，已提取的数据不会因中断丢失
+
+    根据扩展名选择格式：.csv（utf-8-sig，与旧版输出一致）或 .jsonl；
+    finalize_parquet() 可在采集结束后把结果分块转换为Parquet（需安装pyarrow）
+    """
+
+    FIELDS = ['Title', 'Date', 'Citation', 'Abstract', 'Page']
+
+    def __init__(self, path="wos_results.csv", append=False):
+        self.path = path
+        self.format = 'jsonl' if path.endswith('.jsonl') else 'csv'
+        self.count = 0
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+
+        if self.format == 'csv':
+            self._file = open(path, 'a' if exists else 'w', newline='', encoding='utf-8-sig')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.FIELDS, extrasaction='ignore')
+            if not exists:
+                self._writer.writeheader()
+        else:
+            self._file = open(path, 'a' if exists else 'w', encoding='utf-8')
+        self._file.flush()
+
+    def write_rows(self, rows):
+        """追加一页的记录并立即落盘"""
+        for row in rows:
+            if self.format == 'csv':
+                self._writer.writerow(row)
+            else:
+                record = {field: row.get(field) for field in self.FIELDS}
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.count += len(rows)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def finalize_parquet(self, parquet_path=None, chunksize=10000):
+        """把结果文件分块转换为Parquet，返回Parquet文件路径"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.close()
+        parquet_path = parquet_path or os.path.splitext(self.path)[0] + '.parquet'
+        if self.format == 'csv':
+            chunks = pd.read_csv(self.path, chunksize=chunksize, dtype=str, encoding='utf-8-sig')
+        else:
+            chunks = pd.read_json(self.path, lines=True, chunksize=chunksize, dtype=False)
+
+        schema = pa.schema([(field, pa.string()) for field in self.FIELDS])
+        with pq.ParquetWriter(parquet_path, schema) as parquet_writer:
+            for chunk in chunks:
+                chunk = chunk.reindex(columns=self.FIELDS)
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                for field in self.FIELDS:
+                    chunk[field] = chunk[field].map(lambda value: None if value is None else str(value))
+                parquet_writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        return parquet_path
+
+
+class CrawlCheckpoint:
+    """采集断点：记录最后完成的页码、已见过的记录ID和查询上下文，供 resume() 续爬
+
+    页码与上下文保存在 path（JSON，每页整体重写，体积固定）；记录ID逐页追加到旁路文件 path + '.ids'（每行一个），
+    每页只写入新增的ID，不随已采集记录数增长
+    """
+
+    def __init__(self, path="wos_checkpoint.json", state=None):
+        self.path = path
+        self.ids_path = f"{path}.ids"
+        self.state = state or {}
+        self.seen_ids = set()
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r', encoding='utf-8') as f:
+                self.seen_ids.update(line.rstrip('\n') for line in f if line.strip())
+        if 'seen_ids' in self.state:
+            # 旧版断点把ID存在JSON里，迁移到旁路文件
+            self._append_ids(self.state.pop('seen_ids'))
+
+    @classmethod
+    def load(cls, path="wos_checkpoint.json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(path, json.load(f))
+
+    def start(self, **context):
+        """开始一次新的采集：记录参数与查询链接，清空上次留下的记录ID"""
+        self.state.update(context)
+        self.seen_ids.clear()
+        open(self.ids_path, 'w', encoding='utf-8').close()
+
+    def _append_ids(self, record_ids):
+        record_ids = [record_id for record_id in record_ids if record_id not in self.seen_ids]
+        if not record_ids:
+            return
+        with open(self.ids_path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{record_id}\n" for record_id in record_ids)
+            f.flush()
+            os.fsync(f.fileno())
+        self.seen_ids.update(record_ids)
+
+    def page_done(self, page, url, record_ids):
+        # 先追加ID再更新页码：中断在两者之间时重采的这一页会被当作重复记录跳过（数据已写出）
+        self._append_ids(record_ids)
+        self.state.update({
+            'last_completed_page': page,
+            'last_url': url,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        self.save()
+
+    def save(self):
+        # 先写临时文件再替换，避免中断时留下损坏的断点
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def record_key(item):
+    """记录去重键：优先使用WOS记录号，缺失时退化为标题"""
+    return item.get('RecordId') or item.get('Title')
+
+
+def page_url(url, page):
+    """把结果页链接中的页码替换为指定页（形如 .../summary/<查询ID>/<排序>/<页码>）"""
+    new_url, count = re.subn(r'/(\d+)(?=/?(?:[?#]|$))', f'/{page}', url, count=1)
+    return new_url if count else None
+
+
+def process_page(driver, page, current_page, start_page, target_count, extract_mode='script',
+                 writer=None, checkpoint=None, scroll_mode='observer', snapshot_dir="wos_snapshots"):
+    """加载并处理当前标签页中的一页结果：提取（或保存快照）、去重、写出并更新断点
+
+    整页提取或保存快照失败时抛出异常且不更新断点，resume() 会从这一页重新采集
+    """
+    # 执行动态滚动加载
+    if scroll_mode == 'observer':
+        observe_scroll(driver, target_count)
+    else:
+        dynamic_scroll(driver, target_count)
+
+    if extract_mode == 'capture':
+        items = []
+        try:
+            print(f"已保存快照 {capture_page(driver, page, snapshot_dir)}")
+        except Exception as e:
+            print(f"本页快照保存失败: {str(e)}")
+            raise
+    elif extract_mode == 'script':
+        try:
+            items = extract_page_data(driver)
+        except Exception as e:
+            print(f"本页数据提取失败: {str(e)}")
+            raise
+        print(f"本页检测到 {len(items)} 条记录")
+        for item in items:
+            item['Page'] = page
+        print(f"已提取本页 {len(items)} 篇论文数据")
+    else:
+        articles = driver.find_elements(By.CSS_SELECTOR, 'div.summary-record')
+        print(f"本页检测到 {len(articles)} 条记录")
+
+        items = []
+        for idx, article in enumerate(articles):
+            try:
+                item = extract_article_data(start_page, article, idx, current_page, target_count)
+                item['Page'] = page
+                items.append(item)
+                print(f"已提取第 {idx + 1} 篇论文数据")
+            except Exception as e:
+                print(f"第 {idx + 1} 篇数据提取失败: {str(e)}")
+
+    # 去掉与之前页面（或上次运行）以及本页内重复的记录；ID在本页写出后才记入断点
+    if checkpoint is not None:
+        fresh = []
+        page_keys = set()
+        for item in items:
+            key = record_key(item)
+            if key and (key in checkpoint.seen_ids or key in page_keys):
+                continue
+            if key:
+                page_keys.add(key)
+            fresh.append(item)
+        if len(fresh) < len(items):
+            print(f"跳过 {len(items) - len(fresh)} 条重复记录")
+        items = fresh
+
+    # 本页结果立即追加到输出文件，随后更新断点
+    writer.write_rows(items)
+    if checkpoint is not None:
+        checkpoint.page_done(page, driver.current_url, [record_key(item) for item in items if record_key(item)])
+
+
+def crawl(driver, start_page, pages_num, target_count, extract_mode='script',
+          writer=None, checkpoint=None, scroll_mode='observer', snapshot_dir="wos_snapshots"):
+    """从当前结果页开始连续采集 pages_num 页
+
+    scroll_mode='observer' 使用页面内观察器判断加载完成；'human' 为拟人化随机滚动的旧方式。
+    extract_mode='capture' 时只把每页HTML快照保存到 snapshot_dir，不做提取
+    """
+    current_page = 1
+
+    while current_page <= pages_num:
+        page = start_page + current_page - 1
+        print(f"正在处理第 {current_page} 页（第 {page} 页）...")
+
+        process_page(driver, page, current_page, start_page, target_count, extract_mode,
+                     writer, checkpoint, scroll_mode, snapshot_dir)
+
+        # 改进的翻页逻辑
+        if current_page < pages_num:
+            # 使用用户提供的精确CSS路径
+            next_btn = WebDriverWait(driver, 20).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR,
+                                            'body > app-wos > main > div > div > div.holder > div > div > div.held > app-input-route > app-base-summary-component > div > div.results.ng-star-inserted > app-page-controls.app-page-controls.summary-bottom-border > div > form > div > button:nth-child(4)'))
+            )
+
+            # 增强点击可靠性
+            driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", next_btn)
+            time.sleep(1)
+            ActionChains(driver).move_to_element(next_btn).pause(
+                random.uniform(0.8, 1.5)).click().perform()
+
+            # 等待页面稳定
+            WebDriverWait(driver, 25).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR,
+                                                'div.summary-record:not(.loading)'))
+            )
+            # 增加页面加载缓冲
+            time.sleep(random.uniform(2.5, 4.0))
+
+        current_page += 1
+
+
+# 后台标签页的自滚动加载器：页面就绪且链接与预期一致时启动（返回true），之后每隔 stepMs 滚动一屏，
+# 直到记录数达到目标、到达底部且不再增长或超过 maxSteps；切换到该标签页时 observe_scroll 只需补齐剩余部分
+AUTO_SCROLL_SCRIPT = """
+const [url, target, stepMs, maxSteps] = arguments;
+const strip = href => href.split('?')[0].replace(/\\/$/, '');
+if (strip(location.href) !== strip(url) || document.readyState !== 'complete'
+        || !document.querySelector('div.summary-record')) {
+    return false;
+}
+if (window.__wosAutoScroll) return true;
+window.__wosAutoScroll = true;
+let steps = 0, last = -1, idle = 0;
+const timer = setInterval(() => {
+    const count = document.querySelectorAll('div.summary-record').length;
+    const atBottom = window.pageYOffset + window.innerHeight >= document.body.scrollHeight - 100;
+    idle = count === last && !document.querySelector('div.loading-bar') ? idle + 1 : 0;
+    last = count;
+    if (count >= target || (atBottom && idle >= 3) || ++steps > maxSteps) {
+        clearInterval(timer);
+        return;
+    }
+    window.scrollBy({top: Math.max(window.innerHeight * 0.9, 600), behavior: 'auto'});
+}, stepMs);
+return true;
+"""
+
+
+def _wait_for_page(driver, url, timeout=60):
+    """等待标签页完成到 url 的跳转并出现结果记录"""
+    WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+        lambda d: d.current_url.split('?')[0].rstrip('/') == url.split('?')[0].rstrip('/')
+        and d.execute_script(
+            "return document.readyState === 'complete' && !!document.querySelector('div.summary-record');"
+        )
+    )
+
+
+def crawl_tabs(driver, start_page, pages_num, target_count, extract_mode='script',
+               writer=None, checkpoint=None, scroll_mode='observer', snapshot_dir="wos_snapshots",
+               tabs=3, base_url=None, scroll_step_ms=500, max_scroll_steps=200):
+    """在已连接浏览器中打开多个标签页并发加载结果页
+
+    每个标签页预先跳转到各自的页码（不阻塞），依次切换到已加载好的标签页处理，
+    处理完立即让它跳转到下一个待处理页，使页面渲染和网络等待相互重叠；
+    按页码顺序处理和写出，因此结果与单标签页模式顺序一致。
+
+    scroll_mode='observer' 时，后台标签页一加载完成就注入 AUTO_SCROLL_SCRIPT 自行滚动加载记录，
+    滚动加载也与当前页的处理重叠。限制：浏览器会节流后台标签页的定时器（Chrome至少1秒一次），
+    懒加载也可能推迟到标签页可见时才触发，因此后台加载的进度取决于浏览器；
+    未加载完的部分在切换到该标签页后由 observe_scroll 补齐，结果不受影响
+    """
+    base_url = base_url or driver.current_url
+    if page_url(base_url, start_page) is None:
+        raise ValueError(f"无法从链接推算页码，不能使用多标签页模式: {base_url}")
+
+    origin = driver.current_window_handle
+    pages = list(range(start_page, start_page + pages_num))
+    handles = []
+    for _ in range(min(tabs, len(pages))):
+        driver.switch_to.new_window('tab')
+        handles.append(driver.current_window_handle)
+
+    def navigate(handle, page):
+        # 用 location 跳转而不是 driver.get，不等待加载完成
+        driver.switch_to.window(handle)
+        driver.execute_script("window.location.href = arguments[0];", page_url(base_url, page))
+
+    primed = set()  # 已启动自滚动的页码
+
+    def prime_background(current_index):
+        # 给已加载完成的后台标签页启动自滚动，最后切回当前标签页
+        for index in range(current_index + 1, min(current_index + len(handles), len(pages))):
+            if pages[index] in primed:
+                continue
+            driver.switch_to.window(handles[index % len(handles)])
+            if driver.execute_script(AUTO_SCROLL_SCRIPT, page_url(base_url, pages[index]), target_count,
+                                     scroll_step_ms, max_scroll_steps):
+                primed.add(pages[index])
+        driver.switch_to.window(handles[current_index % len(handles)])
+
+    try:
+        for handle, page in zip(handles, pages):
+            navigate(handle, page)
+
+        for index, page in enumerate(pages):
+            handle = handles[index % len(handles)]
+            driver.switch_to.window(handle)
+            print(f"正在处理第 {index + 1} 页（第 {page} 页，标签页 {index % len(handles) + 1}）...")
+            try:
+                _wait_for_page(driver, page_url(base_url, page))
+                if scroll_mode == 'observer':
+                    prime_background(index)
+                process_page(driver, page, index + 1, start_page, target_count, extract_mode,
+                             writer, checkpoint, scroll_mode, snapshot_dir)
+            except TimeoutException:
+                # 断点只记录最后完成的页码，跳过这一页继续会让 resume() 漏掉它，因此停止采集
+                print(f"⚠️ 第 {page} 页加载超时，已停止采集，可稍后用 resume() 从该页续爬")
+                break
+            finally:
+                if index + len(handles) < len(pages):
+                    navigate(handle, pages[index + len(handles)])
+    finally:
+        for handle in handles:
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except Exception:
+                pass
+        driver.switch_to.window(origin)
+
+
+def main(start_page, pages_num, target_count, extract_mode='script',
+         output="wos_results.csv", parquet=False, checkpoint_file="wos_checkpoint.json",
+         scroll_mode='observer', snapshot_dir="wos_snapshots", tabs=1):
+    """extract_mode='script' 每页一次脚本调用提取全部记录；'element' 为逐条 find_element 的旧方式；
+    'capture' 只保存页面快照，之后用 parse_snapshots() 离线解析。
+    tabs>1 时在多个标签页中并发加载结果页
+
+    每页提取完立即追加写入 output（.csv 或 .jsonl）；parquet=True 时结束后额外生成Parquet文件；
+    每完成一页更新 checkpoint_file，中断后用 resume() 续爬
+    """
     driver = connect_existing_browser(9222)
     time.sleep(10)
 
-    data = []
-    current_page = 1
+    # 留出时间登录Web of Science并打开起始页
+    time.sleep(120)
+    print("start...")
+
+    writer = ResultWriter(output)
+    checkpoint = CrawlCheckpoint(checkpoint_file)
+    checkpoint.start(query_url=driver.current_url, start_page=start_page, end_page=start_page + pages_num - 1,
+                     target_count=target_count, extract_mode=extract_mode, output=output,
+                     scroll_mode=scroll_mode, snapshot_dir=snapshot_dir)
+    checkpoint.save()
 
     try:
-        while current_page <= pages_num:
-            print(f"正在处理第 {current_page} 页...")
-
-            # 执行动态滚动加载
-            if current_page==1:
-                time.sleep(120)
-                print("start...")
-            dynamic_scroll(driver)
-
-            articles = driver.find_elements(By.CSS_SELECTOR, 'div.summary-record')
-            print(f"本页检测到 {len(articles)} 条记录")
-
-            for idx, article in enumerate(articles):
-                try:
-                    item = extract_article_data(start_page, article, idx, current_page, target_count)
-                    item['Page'] = start_page + current_page - 1
-                    data.append(item)
-                    print(f"已提取第 {idx + 1} 篇论文数据")
-                except Exception as e:
-                    print(f"第 {idx + 1} 篇数据提取失败: {str(e)}")
-
-            # 改进的翻页逻辑
-            if current_page < pages_num:
-                # 使用用户提供的精确CSS路径
-                next_btn = WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR,
-                                                'body > app-wos > main > div > div > div.holder > div > div > div.held > app-input-route > app-base-summary-component > div > div.results.ng-star-inserted > app-page-controls.app-page-controls.summary-bottom-border > div > form > div > button:nth-child(4)'))
-                )
-
-                # 增强点击可靠性
-                driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", next_btn)
-                time.sleep(1)
-                ActionChains(driver).move_to_element(next_btn).pause(
-                    random.uniform(0.8, 1.5)).click().perform()
-
-                # 等待页面稳定
-                WebDriverWait(driver, 25).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR,
-                                                    'div.summary-record:not(.loading)'))
-                )
-                # 增加页面加载缓冲
-                time.sleep(random.uniform(2.5, 4.0))
-
-            current_page += 1
-            if current_page % 10 == 0:
-                df = pd.DataFrame(data)
-                df.to_csv("wos_results.csv", index=False, encoding='utf-8-sig')
+        if tabs > 1:
+            crawl_tabs(driver, start_page, pages_num, target_count, extract_mode, writer, checkpoint,
+                       scroll_mode, snapshot_dir, tabs=tabs)
+        else:
+            crawl(driver, start_page, pages_num, target_count, extract_mode, writer, checkpoint, scroll_mode,
+                  snapshot_dir)
+    finally:
+        writer.close()
+        print(f"数据已保存，共提取 {writer.count} 条记录")
+        if parquet:
+            print(f"Parquet文件已生成: {writer.finalize_parquet()}")
 
 
+def resume(checkpoint_file="wos_checkpoint.json", parquet=False, tabs=1):
+    """按断点续爬：跳到最后完成页的下一页，跳过已完成的页面并对重叠记录去重"""
+    checkpoint = CrawlCheckpoint.load(checkpoint_file)
+    state = checkpoint.state
+    next_page = state.get('last_completed_page', state['start_page'] - 1) + 1
+    if next_page > state['end_page']:
+        print(f"断点显示第 {state['start_page']}-{state['end_page']} 页已全部完成")
+        return
+
+    driver = connect_existing_browser(9222)
+    url = page_url(state.get('last_url') or state['query_url'], next_page)
+    if url:
+        driver.get(url)
+        WebDriverWait(driver, 25).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'div.summary-record'))
+        )
+    else:
+        print(f"⚠️ 无法从链接推算页码，请在浏览器中手动打开第 {next_page} 页")
+        time.sleep(60)
+    print(f"从第 {next_page} 页续爬，已记录 {len(checkpoint.seen_ids)} 条")
+
+    writer = ResultWriter(state['output'], append=True)
+    try:
+        crawl_args = (driver, next_page, state['end_page'] - next_page + 1, state['target_count'],
+                      state.get('extract_mode', 'script'), writer, checkpoint,
+                      state.get('scroll_mode', 'observer'), state.get('snapshot_dir', "wos_snapshots"))
+        if tabs > 1 and url:
+            crawl_tabs(*crawl_args, tabs=tabs, base_url=url)
+        else:
+            crawl(*crawl_args)
     finally:
-        df = pd.DataFrame(data)
-        df.to_csv("wos_results.csv", index=False, encoding='utf-8-sig')
-        print(f"数据已保存，共提取 {len(data)} 条记录")
+        writer.close()
+        print(f"数据已保存，本次新增 {writer.count} 条记录")
+        if parquet:
+            print(f"Parquet文件已生成: {writer.finalize_parquet()}")
 
 
 if __name__ == "__main__":
@@ -199,4 +757,7 @@ if __name__ == "__main__":
     #    chrome.exe --remote-debugging-port=9222 --user-data-dir=C:\chrome_temp
     # 2. 登录并导航到目标页面
     # 3. 运行此脚本
+    # 中断后续爬：resume()
+    # 只保存快照：main(..., extract_mode='capture')，之后离线解析：parse_snapshots()
+    # 多标签页并发：main(..., tabs=3)
     main(355, 786-355+1, 50)  # example
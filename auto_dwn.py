@@ -3,19 +3,46 @@ from bs4 import BeautifulSoup
 import feedparser
 import re
 import logging
+import logging.handlers
 import csv
+import multiprocessing
 import os
 import random
 import time
-from typing import Optional, Tuple, Dict, List, Any
+from typing import Optional, Tuple, Dict, List, Any, Iterable, Iterator
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import functools
 import hashlib
 import json
 import urllib
+import html
+import unicodedata
+import difflib
+import sqlite3
+import sys
+import threading
+import queue
+import contextlib
+import email.utils
+import shutil
+import asyncio
+import atexit
+import argparse
+import mmap
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import aiohttp  # 异步下载引擎依赖（可选）
+except ImportError:
+    aiohttp = None
+
+try:
+    import pypdf  # PDF页数校验（可选），未安装时退回按对象标记检查
+except ImportError:
+    pypdf = None
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -24,33 +51,52 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
 
-def setup_logging():
-    """初始化日志配置，每次运行清空日志文件"""
-    log_file = 'paper_downloader.log'
+class JsonLogFormatter(logging.Formatter):
+    """每条日志输出为一行JSON；通过 extra={'event': ..., ...} 传入的字段作为结构化字段写入"""
+
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
-    # 清空文件内容（如果文件存在）
-    try:
-        with open(log_file, 'w', encoding='utf-8') as f:
-            pass  # 打开文件并立即关闭以清空内容
-    except Exception as e:
-        print(f"⚠️ 无法清空日志文件: {str(e)}")
-
-    # 配置日志（使用追加模式但文件已被清空）
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        encoding='gbk',
-        force=True
-    )
 
-    # 添加控制台处理器
+def setup_logging(log_file='paper_downloader.jsonl'):
+    """初始化日志配置，每次运行清空日志文件
+
+    工作线程只把日志记录放入内存队列，由单独的监听线程写JSONL文件和控制台，
+    磁盘或终端变慢时不会阻塞下载线程
+    """
+    # 文件以写模式打开，每次运行清空
+    file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(JsonLogFormatter())
+
+    # 控制台处理器
     console = logging.StreamHandler()
     console.setLevel(logging.WARNING)
-    formatter = logging.Formatter('%(levelname)s - %(message)s')
-    console.setFormatter(formatter)
-    logging.getLogger('').addHandler(console)
-    logging.info("🆕 程序启动，日志文件已清空")
+    console.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger('')
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    logging.info("🆕 程序启动，日志文件已清空", extra={'event': 'start'})
+    return listener
 
 
 class SciHubDownloader:
@@ -118,6 +164,7 @@ class SciHubDownloader:
 
     def fetch_pdf_url(self, title):
         """返回 (PDF链接, 错误信息)"""
+        answered = False  # 是否有镜像正常完成了检索（只是没有结果）
         for _ in range(len(self.domain_config)):
             try:
                 # 访问当前域名
@@ -143,6 +190,7 @@ class SciHubDownloader:
                             (By.CSS_SELECTOR, self.current_selectors()["unavailable"])
                         )
                     )
+                    answered = True
                     self._switch_domain()
                     continue
                 except TimeoutException:
@@ -157,53 +205,1079 @@ class SciHubDownloader:
                                    urllib.parse.urlparse(self.current_domain()).netloc
                         pdf_url = urllib.parse.urljoin(base_url, pdf_url)
                     return pdf_url, None
+                answered = True
 
             except Exception as e:
                 logging.error(f"Selenium请求失败: {str(e)}")
                 self._switch_domain()
 
-        return None, "所有镜像尝试失败"
+        # 与 PaperDownloader._fetch_scihub 相同：只有镜像正常应答但没有结果才是确定性的未命中
+        return None, "镜像中未找到PDF链接" if answered else "所有镜像尝试失败"
 
     def close(self):
         self.driver.quit()
 
 
-class RequestCache:
-    """简单的请求缓存类，避免对同一资源重复请求"""
+class ThreadLocalSQLite:
+    """每个线程持有独立连接的SQLite封装（WAL模式，可跨线程/跨进程并发访问）"""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
 
-    def __init__(self, cache_file='request_cache.json'):
+    def _conn(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class RequestCache(ThreadLocalSQLite):
+    """基于SQLite的请求缓存，避免对同一资源重复请求
+
+    - 每个键单独写入，不再整体重写缓存文件
+    - 每个线程使用独立连接，WAL模式下可跨线程/跨进程安全读写
+    - 每条记录带过期时间，负向结果（未找到/失败）比DOI等正向结果更早过期
+    - 超过容量上限时按最近访问时间（LRU）淘汰
+    """
+
+    DEFAULT_TTL = 90 * 24 * 3600  # 正向结果保留90天
+    NEGATIVE_TTL = 3 * 24 * 3600  # 负向结果保留3天
+    MAX_ENTRIES = 1_000_000
+    EVICT_INTERVAL = 1000  # 每写入多少次检查一次容量
+
+    def __init__(self, cache_file='request_cache.db', ttl=DEFAULT_TTL,
+                 negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES,
+                 legacy_file='request_cache.json'):
+        super().__init__(cache_file)
         self.cache_file = cache_file
-        self.cache = {}
-        self._load_cache()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self.metrics = None  # 可选的 RunMetrics，用于统计命中率
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires REAL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires)")
+        conn.commit()
+        self._migrate_legacy(legacy_file)
+
+    def _migrate_legacy(self, legacy_file):
+        """首次使用时导入旧版JSON缓存"""
+        if not legacy_file or not os.path.exists(legacy_file):
+            return
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM cache LIMIT 1").fetchone():
+            return
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logging.warning(f"旧版缓存读取失败，已忽略: {str(e)}")
+            return
+
+        now = time.time()
+        rows = [
+            (key, json.dumps(value, ensure_ascii=False), self._expires_for(value, None, now), now)
+            for key, value in legacy.items()
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        logging.info(f"已从 {legacy_file} 导入 {len(rows)} 条缓存")
+
+    def _expires_for(self, value, ttl, now):
+        if ttl is None:
+            is_negative = isinstance(value, dict) and bool(value.get('error'))
+            ttl = self.negative_ttl if is_negative else self.ttl
+        if not ttl or ttl <= 0:
+            return None  # 永不过期
+        return now + ttl
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count('miss')
+            return None
+        value, expires = row
+        if expires is not None and expires < now:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._count('expired')
+            return None
+        with conn:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        self._count('hit')
+        return json.loads(value)
+
+    def _count(self, result: str):
+        if self.metrics is not None:
+            self.metrics.inc('cache_requests_total', result=result)
+
+    def set(self, key, value, ttl=None):
+        """写入单个键；ttl为None时按结果正负自动选择过期时间"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), self._expires_for(value, ttl, now), now)
+            )
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.EVICT_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期记录，并按LRU把记录数压到容量上限以内，返回删除条数"""
+        conn = self._conn()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (time.time(),)
+            ).rowcount
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if self.max_entries and count > self.max_entries:
+                removed += conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+        return removed
+
+    def merge_from(self, other_file: str) -> int:
+        """合并另一个缓存文件（如分片运行产生的缓存），同一键保留最近访问的记录，返回合并的条数"""
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("ATTACH DATABASE ? AS other", (other_file,))
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO cache (key, value, expires, accessed) "
+                    "SELECT key, value, expires, accessed FROM other.cache WHERE true "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires, "
+                    "accessed = excluded.accessed WHERE excluded.accessed > cache.accessed"
+                )
+        finally:
+            conn.execute("DETACH DATABASE other")
+        return conn.total_changes - before
+
+    def compact(self) -> Dict[str, int]:
+        """淘汰过期/超量记录并回收磁盘空间"""
+        removed = self.evict()
+        conn = self._conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        remaining = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {'removed': removed, 'remaining': remaining}
+
+
+class PdfStore(ThreadLocalSQLite):
+    """按内容哈希存储PDF的本地库
+
+    实际文件保存在 save_dir/.store/objects/<哈希前两位>/<sha256>.pdf，
+    清单（manifest.db）记录 DOI→哈希 与 标题→哈希 的映射，
+    按标题命名的可读路径只是指向该文件的硬链接（不支持时退化为符号链接或复制）。
+    分片运行时每个分片使用自己的清单（manifest 参数），只共用按内容命名的 objects 目录，
+    结束后由 merge_from 合并到 manifest.db。
+    """
+
+    def __init__(self, save_dir, manifest='manifest.db'):
+        self.root = os.path.join(save_dir, '.store')
+        self.objects_dir = os.path.join(self.root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        super().__init__(os.path.join(self.root, manifest))
+        self._key_locks = {}  # 键 -> [锁, 引用数]
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS dois (doi TEXT PRIMARY KEY, sha256 TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS titles ("
+            "title TEXT PRIMARY KEY, doi TEXT, sha256 TEXT NOT NULL, path TEXT)"
+        )
+        conn.commit()
+
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """同一DOI/标题的下载串行化，避免并发任务重复下载同一篇论文
+
+        锁按引用计数保存，最后一个持有者释放后即删除，长时间的流式运行中锁表大小只与在途任务数有关
+        """
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.pdf")
+
+    def lookup(self, doi: Optional[str] = None, title: Optional[str] = None) -> Optional[str]:
+        """按DOI或标题查找已入库的文件，返回实际文件路径"""
+        conn = self._conn()
+        row = None
+        if doi:
+            row = conn.execute("SELECT sha256 FROM dois WHERE doi = ?", (doi.lower(),)).fetchone()
+        if row is None and title:
+            row = conn.execute("SELECT sha256 FROM titles WHERE title = ?", (title_key(title),)).fetchone()
+        if row and os.path.exists(path := self.blob_path(row[0])):
+            return path
+        return None
 
-    def _load_cache(self):
-        if os.path.exists(self.cache_file):
+    def add(self, file_path: str, doi: Optional[str] = None, title: Optional[str] = None) -> str:
+        """把下载好的文件移入库中，并在原路径放置链接，返回实际文件路径"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(functools.partial(f.read, 1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        blob = self.blob_path(sha256)
+
+        if os.path.exists(blob):
+            os.remove(file_path)  # 内容已在库中，丢弃重复副本
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(file_path, blob)
+        self.link(blob, file_path)
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, size, created) VALUES (?, ?, ?)",
+                (sha256, os.path.getsize(blob), time.time())
+            )
+            if doi:
+                conn.execute("INSERT OR REPLACE INTO dois (doi, sha256) VALUES (?, ?)", (doi.lower(), sha256))
+            if title:
+                conn.execute(
+                    "INSERT OR REPLACE INTO titles (title, doi, sha256, path) VALUES (?, ?, ?, ?)",
+                    (title_key(title), doi, sha256, file_path)
+                )
+        return blob
+
+    def link(self, blob: str, target: str):
+        """在可读路径上创建指向库文件的链接：硬链接 > 符号链接 > 复制"""
+        tmp_path = f"{target}.link"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
             try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache = json.load(f)
-            except:
-                self.cache = {}
+                os.symlink(os.path.abspath(blob), tmp_path)
+            except OSError:
+                shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, target)
+
+    def merge_from(self, other_file: str) -> int:
+        """合并另一个清单（如分片运行产生的清单），同一DOI/标题以被合并的清单为准，返回合并的条数"""
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("ATTACH DATABASE ? AS other", (other_file,))
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO blobs SELECT sha256, size, created FROM other.blobs")
+                conn.execute("INSERT OR REPLACE INTO dois SELECT doi, sha256 FROM other.dois")
+                conn.execute("INSERT OR REPLACE INTO titles SELECT title, doi, sha256, path FROM other.titles")
+        finally:
+            conn.execute("DETACH DATABASE other")
+        return conn.total_changes - before
+
+    def record_title(self, title: str, doi: Optional[str], blob: str, path: str):
+        conn = self._conn()
+        sha256 = os.path.splitext(os.path.basename(blob))[0]
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO titles (title, doi, sha256, path) VALUES (?, ?, ?, ?)",
+                (title_key(title), doi, sha256, path)
+            )
+
+
+def normalize_title(title: str) -> str:
+    """标题归一化：还原HTML实体、统一大小写与全半角、去除标点并合并空白"""
+    title = unicodedata.normalize('NFKC', html.unescape(title or ''))
+    title = re.sub(r'[^\w\s]', ' ', title.lower())
+    return ' '.join(title.replace('_', ' ').split())
+
+
+def title_key(title: str) -> str:
+    """去重和缓存使用的标题键：归一化后为空（如只有标点）时退回原始标题"""
+    return normalize_title(title) or (title or '').strip()
+
+
+def group_titles(titles: List[str], near_threshold: Optional[float] = None) -> Dict[str, List[str]]:
+    """把同一篇论文的不同写法归为一组，返回 {代表标题: [组内各原始标题]}
+
+    代表标题为组内第一次出现的写法，按出现顺序排列；组内原始标题去掉完全相同的重复。
+    near_threshold 不为None时，再把归一化后相似度不低于该值的标题合并（拼写差异等近似重复）；
+    其中的数字必须完全相同，避免把 Part 1/Part 2 这类不同论文合并
+    """
+    groups = {}  # 标题键 -> [原始标题]
+    for title in titles:
+        members = groups.setdefault(title_key(title), [])
+        if title not in members:
+            members.append(title)
+
+    if near_threshold is not None:
+        # 倒排索引：词 -> 已保留的标题键；新标题只与共享其最长几个词的标题比较
+        index = {}
+        for key in list(groups):
+            tokens = sorted(set(key.split()), key=len, reverse=True)[:3]
+            numbers = re.findall(r'\d+', key)
+            match = None
+            for candidate in dict.fromkeys(c for token in tokens for c in index.get(token, ())):
+                if re.findall(r'\d+', candidate) != numbers:
+                    continue
+                matcher = difflib.SequenceMatcher(None, key, candidate)
+                if (matcher.real_quick_ratio() >= near_threshold and matcher.quick_ratio() >= near_threshold
+                        and matcher.ratio() >= near_threshold):
+                    match = candidate
+                    break
+            if match is not None:
+                groups[match].extend(t for t in groups.pop(key) if t not in groups[match])
+            else:
+                for token in set(key.split()):
+                    index.setdefault(token, []).append(key)
+
+    return {members[0]: members for members in groups.values()}
+
+
+def title_similarity(a: str, b: str) -> float:
+    """基于归一化标题的相似度（0~1）"""
+    a, b = normalize_title(a), normalize_title(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+PDF_TAIL_WINDOW = 64 * 1024  # 在文件末尾这么多字节内查找 %%EOF，容忍服务器在结尾追加的多余内容
+XREF_SEARCH_WINDOW = 1024  # startxref 偏移量不准时，在其前后这么多字节内查找交叉引用
+XREF_PATTERN = re.compile(rb'(?<![A-Za-z])xref\b|\d+\s+\d+\s+obj\b')
+
+
+def _xref_near(data, offset: int) -> bool:
+    """offset 附近是否有 xref 表或（交叉引用流所在的）间接对象"""
+    start = max(0, offset - XREF_SEARCH_WINDOW)
+    return XREF_PATTERN.search(data[start:offset + XREF_SEARCH_WINDOW]) is not None
+
+
+def validate_pdf(path: str) -> Optional[str]:
+    """检查PDF文件结构，通过返回None，否则返回错误信息
+
+    - 文件头：前1024字节内有 %PDF-
+    - 安装了pypdf时由 PdfReader(strict=False) 决定：能打开（pypdf会自行修复偏移量、重建交叉引用）且至少有一页即通过
+    - 未安装pypdf时按结构检查，与阅读器一样容忍轻微损坏：
+      - 结尾：最后64KB内有 %%EOF（截断的文件没有）
+      - 交叉引用：startxref 指向位置附近有 xref 表或对象；偏移量错得太远时，只要文件中有对象即可重建
+      - 页数：页面对象未被压缩进对象流时须能找到页面对象
+    在进程池中运行，因此是模块级函数；用mmap读取，不把整个文件读入内存
+    """
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return "PDF校验失败: 文件为空"
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            base = data.find(b'%PDF-', 0, 1024)
+            if base < 0:
+                return "PDF校验失败: 缺少%PDF文件头"
+            if pypdf is None:
+                eof = data.rfind(b'%%EOF', max(0, size - PDF_TAIL_WINDOW))
+                if eof < 0:
+                    return "PDF校验失败: 缺少%%EOF结尾，文件可能被截断"
+                startxref = data.rfind(b'startxref', 0, eof)
+                match = re.match(rb'startxref\s+(\d+)', data[startxref:eof]) if startxref >= 0 else None
+                # 文件头前有多余字节时，偏移量可能从文件开头或从 %PDF 处算起
+                if not (match and any(_xref_near(data, start) for start in {int(match[1]), int(match[1]) + base}
+                                      if start < size)):
+                    if not re.search(rb'\d+\s+\d+\s+obj\b', data):
+                        return "PDF校验失败: 找不到交叉引用表或对象"
+                if data.find(b'/ObjStm') < 0 and not re.search(rb'/Type\s*/Page(?![A-Za-z])', data):
+                    return "PDF校验失败: 找不到页面对象"
+                return None
+        if not len(pypdf.PdfReader(path, strict=False).pages):
+            return "PDF校验失败: 没有页面"
+        return None
+    except Exception as e:
+        return f"PDF校验失败: {str(e) or type(e).__name__}"
 
-    def _save_cache(self):
-        with open(self.cache_file, 'w', encoding='utf-8') as f:
-            json.dump(self.cache, f)
 
-    def get(self, key):
-        return self.cache.get(key)
+# 错误类别
+PERMANENT = 'permanent'  # 确定性失败：换个时间重试结果也不会变，立即换下一个来源
+TRANSIENT = 'transient'  # 临时失败：指数退避后重试
+RATE_LIMITED = 'rate_limited'  # 被限流：由HostScheduler按Retry-After暂停主机，不再额外退避
+
+PERMANENT_ERRORS = (
+    "未找到DOI", "未找到arXiv论文", "镜像中未找到PDF链接",
+    "下载内容不是PDF文件", "下载的文件不是有效的PDF",
+)
+PERMANENT_HTTP_STATUS = re.compile(r'HTTP (400|401|403|404|410|451)\b')
+RATE_LIMITED_HTTP_STATUS = re.compile(r'HTTP (429|503)\b')
 
-    def set(self, key, value):
-        self.cache[key] = value
-        # 定期保存缓存
-        if len(self.cache) % 10 == 0:
-            self._save_cache()
 
-    def __del__(self):
-        self._save_cache()
+def classify_error(error: Optional[str]) -> Optional[str]:
+    """把错误信息归类为 PERMANENT / TRANSIENT / RATE_LIMITED"""
+    if not error:
+        return None
+    if RATE_LIMITED_HTTP_STATUS.search(error) or '限流' in error:
+        return RATE_LIMITED
+    if error.startswith(PERMANENT_ERRORS) or PERMANENT_HTTP_STATUS.search(error):
+        return PERMANENT
+    return TRANSIENT
+
+
+def worst_error_class(classes: Iterable[Optional[str]]) -> Optional[str]:
+    """合并各来源的错误类别：只有每个来源都确定性失败才算 PERMANENT，否则取可重试的类别"""
+    classes = [error_class or TRANSIENT for error_class in classes]
+    if not classes:
+        return None
+    if all(error_class == PERMANENT for error_class in classes):
+        return PERMANENT
+    return TRANSIENT if TRANSIENT in classes else RATE_LIMITED
+
+
+# 对冲解析中落选来源的返回信息（不写缓存，也不会作为最终错误记录）
+HEDGE_CANCELLED = "对冲解析已取消"
+
+
+def retry_delay(error: Optional[str], attempt: int) -> Optional[float]:
+    """根据错误类别决定重试前等待的秒数；返回None表示不应重试"""
+    error_class = classify_error(error)
+    if error_class == PERMANENT:
+        return None
+    if error_class == RATE_LIMITED:
+        return 0.0
+    return min(2 ** attempt, 10)  # 指数退避最大10秒
+
+
+class RunJournal(ThreadLocalSQLite):
+    """批量运行日志：按标题记录状态、来源、错误类别与时间，用于中断后续跑"""
+
+    DONE_STATUSES = ('成功', '跳过')
+
+    def __init__(self, journal_file='run_journal.db'):
+        super().__init__(journal_file)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "title TEXT PRIMARY KEY, doi TEXT, status TEXT NOT NULL, method TEXT, "
+            "error TEXT, error_class TEXT, save_path TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_doi ON journal(doi)")
+        conn.commit()
+
+    def mark_pending(self, titles: List[str]):
+        """登记待处理的标题（已有记录的保持不变）"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO journal (title, status, updated) VALUES (?, 'pending', ?)",
+                ((title, now) for title in titles)
+            )
+
+    def record(self, result: dict, doi: Optional[str] = None):
+        conn = self._conn()
+        error = result.get('error') if result['status'] != '成功' else None
+        # 成功/跳过的记录没有错误类别（跳过时的“文件已存在”不是失败）
+        error_class = None if result['status'] in self.DONE_STATUSES else (
+            result.get('error_class') or classify_error(error))
+        with conn:
+            conn.execute(
+                "INSERT INTO journal (title, doi, status, method, error, error_class, save_path, attempts, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(title) DO UPDATE SET doi = COALESCE(excluded.doi, doi), status = excluded.status, "
+                "method = excluded.method, error = excluded.error, error_class = excluded.error_class, "
+                "save_path = excluded.save_path, attempts = attempts + 1, updated = excluded.updated",
+                (result['title'], doi or result.get('doi'), result['status'], result.get('method'), error,
+                 error_class, result.get('save_path'), time.time())
+            )
+
+    def finished_titles(self) -> set:
+        """不需要再处理的标题：已成功/跳过，或确定性失败"""
+        rows = self._conn().execute(
+            "SELECT title FROM journal WHERE status IN (?, ?) OR error_class = ?",
+            (*self.DONE_STATUSES, PERMANENT)
+        )
+        return {row[0] for row in rows}
+
+    def merge_from(self, other_file: str) -> int:
+        """合并另一个运行日志（如分片运行产生的日志），同一标题保留最后更新的记录，返回合并的条数"""
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("ATTACH DATABASE ? AS other", (other_file,))
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO journal SELECT * FROM other.journal WHERE true "
+                    "ON CONFLICT(title) DO UPDATE SET doi = COALESCE(excluded.doi, doi), status = excluded.status, "
+                    "method = excluded.method, error = excluded.error, error_class = excluded.error_class, "
+                    "save_path = excluded.save_path, attempts = excluded.attempts, updated = excluded.updated "
+                    "WHERE excluded.updated > journal.updated"
+                )
+        finally:
+            conn.execute("DETACH DATABASE other")
+        return conn.total_changes - before
+
+    def is_finished(self, title: str) -> bool:
+        """逐条查询版本的 finished_titles，流式处理时不必把所有已完成标题读入内存"""
+        row = self._conn().execute(
+            "SELECT 1 FROM journal WHERE title = ? AND (status IN (?, ?) OR error_class = ?)",
+            (title, *self.DONE_STATUSES, PERMANENT)
+        ).fetchone()
+        return row is not None
+
+    def summary(self) -> Dict[str, int]:
+        rows = self._conn().execute(
+            "SELECT COALESCE(error_class, status), COUNT(*) FROM journal GROUP BY 1"
+        )
+        return dict(rows.fetchall())
+
+
+class ResolveManifest:
+    """解析清单（JSONL，每行一条解析记录），记录标题解析出的候选PDF链接
+
+    重新运行时可直接从清单取出已解析的链接进入下载阶段，跳过解析
+    """
+
+    def __init__(self, manifest_file='resolve_manifest.jsonl'):
+        self.manifest_file = manifest_file
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, dict]:
+        """读取清单，返回每个标题最新的一条记录"""
+        records = {}
+        if not os.path.exists(self.manifest_file):
+            return records
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 跳过中断时写了一半的行
+                records[record['title']] = record
+        return records
+
+    def append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.manifest_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class HostScheduler:
+    """所有请求共用的按主机调度器
+
+    - 每个主机一个令牌桶控制请求速率，另限制同时在途的请求数
+    - 收到429/503时遵守Retry-After暂停该主机，并把速率减半；之后每次成功缓慢回升到上限
+    - stats() 给出每个主机的在途数与排队数
+    """
+
+    class _Host:
+        def __init__(self, rate, burst, max_in_flight):
+            self.max_rate = rate
+            self.rate = rate
+            self.burst = burst
+            self.tokens = burst
+            self.updated = time.monotonic()
+            self.max_in_flight = max_in_flight
+            self.in_flight = 0
+            self.waiting = 0
+            self.blocked_until = 0.0
+            self.cond = None  # 同步模式的并发控制，由调度器创建
+            self.async_slots = None  # 异步模式的并发控制，在事件循环内创建
+
+    def __init__(self, default_rate=5.0, default_burst=5, default_max_in_flight=8):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.default_max_in_flight = default_max_in_flight
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.metrics = None  # 可选的 RunMetrics，记录每次请求的排队等待时间
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urllib.parse.urlsplit(url).netloc.lower()
+
+    def configure(self, host: str, rate=None, burst=None, max_in_flight=None):
+        """为某个主机单独设置速率（请求/秒）、突发量和最大在途数"""
+        state = self._state(host)
+        with self._lock:
+            if rate is not None:
+                state.max_rate = state.rate = rate
+            if burst is not None:
+                state.burst = state.tokens = burst
+            if max_in_flight is not None:
+                state.max_in_flight = max_in_flight
+
+    def _state(self, host: str) -> '_Host':
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._Host(self.default_rate, self.default_burst, self.default_max_in_flight)
+                state.cond = threading.Condition(self._lock)
+                self._hosts[host] = state
+            return state
+
+    def _reserve(self, state: '_Host') -> float:
+        """从令牌桶预约一个令牌，返回需要等待的秒数（调用方需持有锁）"""
+        now = time.monotonic()
+        if state.rate > 0:
+            state.tokens = min(state.burst, state.tokens + (now - state.updated) * state.rate)
+            state.updated = now
+            state.tokens -= 1
+            wait_time = max(0.0, -state.tokens / state.rate)
+        else:
+            wait_time = 0.0
+        return max(wait_time, state.blocked_until - now)
+
+    @contextlib.contextmanager
+    def slot(self, url: str):
+        """同步请求的调度上下文：等待在途名额与令牌后放行"""
+        host = self.host_of(url)
+        state = self._state(host)
+        began = time.monotonic()
+        with self._lock:
+            state.waiting += 1
+            while state.max_in_flight and state.in_flight >= state.max_in_flight:
+                state.cond.wait()
+            state.in_flight += 1
+            wait_time = self._reserve(state)
+            state.waiting -= 1
+        try:
+            if wait_time:
+                time.sleep(wait_time)
+            self._observe_wait(host, began)
+            yield
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+                state.cond.notify()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, url: str):
+        """异步请求的调度上下文"""
+        host = self.host_of(url)
+        state = self._state(host)
+        began = time.monotonic()
+        if state.async_slots is None and state.max_in_flight:
+            state.async_slots = asyncio.Semaphore(state.max_in_flight)
+        with self._lock:
+            state.waiting += 1
+        try:
+            if state.async_slots is not None:
+                await state.async_slots.acquire()
+        finally:
+            with self._lock:
+                state.waiting -= 1
+        with self._lock:
+            state.in_flight += 1
+            wait_time = self._reserve(state)
+        try:
+            if wait_time:
+                await asyncio.sleep(wait_time)
+            self._observe_wait(host, began)
+            yield
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+            if state.async_slots is not None:
+                state.async_slots.release()
+
+    def _observe_wait(self, host: str, began: float):
+        if self.metrics is not None:
+            self.metrics.observe('stage_seconds', time.monotonic() - began, stage='wait', source=host)
+
+    def reset_async(self):
+        """新的事件循环开始前调用，丢弃绑定在旧循环上的信号量"""
+        with self._lock:
+            for state in self._hosts.values():
+                state.async_slots = None
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def observe(self, url: str, status: int, headers=None):
+        """根据响应调整主机速率：429/503 暂停并降速，成功时逐步恢复"""
+        state = self._state(self.host_of(url))
+        with self._lock:
+            if status in (429, 503):
+                retry_after = self._parse_retry_after((headers or {}).get('Retry-After'))
+                pause = retry_after if retry_after is not None else 1.0 / max(state.rate, 0.1)
+                state.blocked_until = max(state.blocked_until, time.monotonic() + pause)
+                state.rate = max(state.max_rate / 16, state.rate / 2)
+                state.tokens = min(state.tokens, 0)
+                logging.warning(f"⏳ {self.host_of(url)} 限流 HTTP {status}，暂停 {pause:.1f}s")
+            elif status < 400 and state.rate < state.max_rate:
+                state.rate = min(state.max_rate, state.rate + state.max_rate / 20)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """每个主机的当前速率、在途数、排队数与剩余暂停时间"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    'rate': round(state.rate, 3),
+                    'in_flight': state.in_flight,
+                    'waiting': state.waiting,
+                    'blocked_for': round(max(0.0, state.blocked_until - now), 3),
+                }
+                for host, state in self._hosts.items()
+            }
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(state.waiting for state in self._hosts.values())
+
+
+class RunMetrics:
+    """下载过程的计时与计数指标
+
+    - 按 阶段/来源 记录耗时直方图（resolve/crossref、resolve/arxiv、transfer/主机、wait/主机、sleep/来源 等）
+    - 计数：传输字节数、重试次数、缓存命中/未命中
+    - 工作线程利用率：处理标题的累计时间 / (工作线程数 × 运行时间)
+    - 设置了 scheduler 时导出每个主机的当前速率、在途数、排队数与剩余暂停时间（gauge）
+    - summary() 导出JSON摘要，prometheus() 导出Prometheus文本格式，serve() 提供实时 /metrics 端点
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    PREFIX = 'paper_'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (名称, 标签) -> [各桶计数, 总和, 次数]
+        self._counters = {}  # (名称, 标签) -> 值
+        self.workers = 0
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started = time.monotonic()
+        self._started_at = time.time()
+        self._stopped = None
+        self.scheduler = None  # 可选的 HostScheduler，导出每个主机的调度状态
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += seconds
+            hist[2] += 1
+
+    def inc(self, name: str, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    class _Timer:
+        """同时支持 with 与 async with 的计时上下文"""
+
+        def __init__(self, metrics, stage, source):
+            self.metrics = metrics
+            self.labels = {'stage': stage, 'source': source}
+            self.began = None
+
+        def __enter__(self):
+            self.began = time.monotonic()
+            return self
+
+        def __exit__(self, *exc):
+            self.metrics.observe('stage_seconds', time.monotonic() - self.began, **self.labels)
+
+        async def __aenter__(self):
+            return self.__enter__()
+
+        async def __aexit__(self, *exc):
+            self.__exit__(*exc)
+
+    def timer(self, stage: str, source: str) -> '_Timer':
+        """记录一个阶段的耗时"""
+        return self._Timer(self, stage, source)
+
+    @contextlib.contextmanager
+    def busy(self):
+        """工作线程处理一个标题期间调用，用于计算利用率"""
+        began = time.monotonic()
+        with self._lock:
+            self._busy += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - began
+
+    def start(self, workers: int):
+        """开始一次下载运行：重新计算利用率的时间窗口（直方图与计数保留预解析阶段的数据）"""
+        with self._lock:
+            self.workers = workers
+            self._busy_seconds = 0.0
+            self._started = time.monotonic()
+            self._started_at = time.time()
+            self._stopped = None
+
+    def stop(self):
+        self._stopped = time.monotonic()
+
+    def elapsed(self) -> float:
+        return (self._stopped or time.monotonic()) - self._started
+
+    def _counter_total(self, name: str, **match) -> float:
+        return sum(
+            value for (key, labels), value in self._counters.items()
+            if key == name and all((k, str(v)) in labels for k, v in match.items())
+        )
+
+    def cache_hit_rate(self) -> Optional[float]:
+        with self._lock:
+            hits = self._counter_total('cache_requests_total', result='hit')
+            total = self._counter_total('cache_requests_total')
+        return round(hits / total, 4) if total else None
+
+    def utilization(self) -> Optional[float]:
+        elapsed = self.elapsed()
+        if not self.workers or elapsed <= 0:
+            return None
+        return round(min(1.0, self._busy_seconds / (self.workers * elapsed)), 4)
+
+    def _quantile(self, hist, q: float) -> Optional[float]:
+        """按桶线性插值估计分位数（与Prometheus的histogram_quantile一致）"""
+        buckets, _, count = hist
+        if not count:
+            return None
+        rank = q * count
+        cumulative, lower = 0, 0.0
+        for bound, n in zip(self.BUCKETS, buckets):
+            if n and cumulative + n >= rank:
+                return round(lower + (bound - lower) * (rank - cumulative) / n, 4)
+            cumulative += n
+            lower = bound
+        return self.BUCKETS[-1]
+
+    @staticmethod
+    def _label_text(labels) -> str:
+        return ','.join(f'{key}="{value}"' for key, value in labels)
+
+    def _host_stats(self) -> Dict[str, Dict[str, float]]:
+        return self.scheduler.stats() if self.scheduler is not None else {}
+
+    def summary(self, stats: Optional[Dict[str, int]] = None) -> dict:
+        hosts = self._host_stats()
+        with self._lock:
+            stages = {}
+            for (name, labels), hist in sorted(self._histograms.items()):
+                label_map = dict(labels)
+                stages[f"{label_map.get('stage')}/{label_map.get('source')}"] = {
+                    'count': hist[2],
+                    'total_seconds': round(hist[1], 3),
+                    'mean': round(hist[1] / hist[2], 4) if hist[2] else None,
+                    'p50': self._quantile(hist, 0.5),
+                    'p90': self._quantile(hist, 0.9),
+                    'p99': self._quantile(hist, 0.99),
+                }
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, {})[self._label_text(labels) or 'total'] = value
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._started_at)),
+            'elapsed_seconds': round(self.elapsed(), 3),
+            'workers': self.workers,
+            'worker_utilization': self.utilization(),
+            'cache_hit_rate': self.cache_hit_rate(),
+            'stats': stats,
+            'stages': stages,
+            'counters': counters,
+            'queue_depth': self.scheduler.queue_depth() if self.scheduler is not None else None,
+            'hosts': hosts,
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            busy = self._busy
+        typed = set()
+        for (name, labels), (buckets, total, count) in histograms:
+            metric = self.PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            label_text = self._label_text(labels)
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{metric}_count{{{label_text}}} {count}")
+        for (name, labels), value in counters:
+            metric = self.PREFIX + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{{{self._label_text(labels)}}} {value}")
+        gauges = {
+            'workers': self.workers,
+            'workers_busy': busy,
+            'worker_utilization': self.utilization(),
+            'cache_hit_rate': self.cache_hit_rate(),
+        }
+        for name, value in gauges.items():
+            if value is not None:
+                lines.append(f"# TYPE {self.PREFIX}{name} gauge")
+                lines.append(f"{self.PREFIX}{name} {value}")
+        hosts = self._host_stats()
+        if hosts:
+            lines.append(f"# TYPE {self.PREFIX}queue_depth gauge")
+            lines.append(f"{self.PREFIX}queue_depth {self.scheduler.queue_depth()}")
+        for field, name in (('rate', 'host_rate'), ('in_flight', 'host_in_flight'),
+                            ('waiting', 'host_waiting'), ('blocked_for', 'host_blocked_seconds')):
+            if hosts:
+                lines.append(f"# TYPE {self.PREFIX}{name} gauge")
+            for host, host_stats in sorted(hosts.items()):
+                lines.append(f'{self.PREFIX}{name}{{host="{host}"}} {host_stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, summary_file: Optional[str] = None, prometheus_file: Optional[str] = None,
+              stats: Optional[Dict[str, int]] = None):
+        """写出JSON摘要与Prometheus文本文件（先写临时文件再替换，读取方不会看到半个文件）"""
+        for path, content in ((summary_file, lambda: json.dumps(self.summary(stats), ensure_ascii=False, indent=2)),
+                              (prometheus_file, self.prometheus)):
+            if path:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(content())
+                os.replace(tmp_path, path)
+
+    def serve(self, port: int, host='127.0.0.1') -> ThreadingHTTPServer:
+        """在后台线程提供 http://host:port/metrics 实时指标"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        logging.info(f"📈 指标端点: http://{host}:{server.server_address[1]}/metrics")
+        return server
 
 
 class PaperDownloader:
-    def __init__(self, max_workers=5):
+    def __init__(self, max_workers=5, cache_file='request_cache.db',
+                 crossref_rate=10, crossref_mailto=None,
+                 max_concurrency=1000, per_host_limit=8, chunk_size=256 * 1024,
+                 use_store=True, journal_file='run_journal.db',
+                 negative_ttl=RequestCache.NEGATIVE_TTL, hedge_delay=None,
+                 metrics_file='run_metrics.json', prometheus_file='run_metrics.prom', metrics_port=None,
+                 near_duplicate_threshold=None, result_csv='download_results.csv',
+                 manifest_file='resolve_manifest.jsonl', validate_pdfs=True, validate_workers=None,
+                 store_manifest='manifest.db'):
         self.max_workers = max_workers
+        # 下载完成后在独立进程池中校验PDF结构；校验失败的文件被删除并按临时错误重新下载
+        self.validate_pdfs = validate_pdfs
+        self.validate_workers = validate_workers
+        self._validate_pool = None
+        # 结果CSV与流水线解析清单的路径（分片运行时每个分片各用一份）
+        self.result_csv = result_csv
+        self.manifest_file = manifest_file
+        # 重复标题在下载前合并，结果CSV中每个原始写法各写一行；阈值不为None时同时合并近似重复
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._duplicates = {}  # 代表标题 -> 被合并的其他写法
+        # 运行指标：结束时写出JSON摘要和Prometheus文本；metrics_port 不为None时运行期间提供 /metrics 端点
+        self.metrics = RunMetrics()
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.metrics_port = metrics_port
+        # 运行日志，记录每个标题的处理状态，供 resume 续跑
+        self.journal_file = journal_file
+        self.journal = None
+        # 对冲解析：None为按顺序尝试来源；否则同时（或间隔hedge_delay秒）启动DOI与arXiv解析，取最先得到的链接
+        self.hedge_delay = hedge_delay
+        self.hedge_sources = ('Sci-Hub (DOI)', 'arXiv')
+        self._io_pool = None  # 异步引擎的文件/SQLite线程池，None时使用事件循环的默认线程池
+        self._append_results = False
+        # 是否启用按DOI/内容哈希去重的本地库（在download_papers中按保存目录创建），分片运行时各用一份清单
+        self.use_store = use_store
+        self.store_manifest = store_manifest
+        self.store = None
+        # 流式下载的分块大小，决定每个下载任务常驻内存的上限
+        self.chunk_size = chunk_size
+        # 异步引擎参数：同时处理的标题数上限、单个主机的并发连接上限
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
         self.scihub_urls = [
             "https://www.sci-hub.ru/",
             "https://www.sci-hub.se/",
@@ -219,8 +1293,22 @@ class PaperDownloader:
         # 将工作良好的镜像移到前面
         random.shuffle(self.scihub_urls)
 
-        self.arxiv_api = "http://export.arxiv.org/api/query?search_query=ti:{}"
-        self.crossref_api = "https://api.crossref.org/works?query.title={}"
+        self.arxiv_api = "http://export.arxiv.org/api/query"
+        self.arxiv_match_threshold = 0.9  # 标题相似度低于该值视为不是同一篇论文
+        # 只请求第一条结果的DOI字段，减少响应体积和JSON解析开销
+        self.crossref_api = "https://api.crossref.org/works?query.title={}&rows=1&select=DOI"
+        if crossref_mailto:
+            # 带上联系邮箱可进入CrossRef的polite池
+            self.crossref_api += f"&mailto={urllib.parse.quote(crossref_mailto)}"
+
+        # 所有请求共用的按主机调度器；arXiv要求请求间隔不小于3秒且不要并发
+        self.scheduler = HostScheduler(default_max_in_flight=per_host_limit)
+        self.scheduler.configure(HostScheduler.host_of(self.crossref_api),
+                                 rate=crossref_rate, burst=crossref_rate)
+        self.scheduler.configure(HostScheduler.host_of(self.arxiv_api),
+                                 rate=1 / 3, burst=1, max_in_flight=1)
+        self.scheduler.metrics = self.metrics
+        self.metrics.scheduler = self.scheduler
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36",
             "Accept-Language": "en-US,en;q=0.9",
@@ -230,7 +1318,9 @@ class PaperDownloader:
 
         # 创建更可靠的session
         self.session = self._create_robust_session()
-        self.cache = RequestCache()
+        # 确定性未命中使用单独的（较短的）缓存有效期
+        self.cache = RequestCache(cache_file, negative_ttl=negative_ttl)
+        self.cache.metrics = self.metrics
         self.active_mirrors = []  # 跟踪工作良好的镜像
 
     def _create_robust_session(self):
@@ -239,7 +1329,7 @@ class PaperDownloader:
         retry_strategy = Retry(
             total=3,
             backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=[500, 502, 504],  # 429/503由HostScheduler按Retry-After处理
             allowed_methods=["GET", "POST"]
         )
         adapter = HTTPAdapter(max_retries=retry_strategy)
@@ -248,88 +1338,238 @@ class PaperDownloader:
         session.headers.update(self.headers)
         return session
 
+    @staticmethod
+    def _doi_cache_key(title: str) -> str:
+        return f"doi:{hashlib.md5(title_key(title).encode()).hexdigest()}"
+
+    @staticmethod
+    def _arxiv_cache_key(title: str) -> str:
+        return f"arxiv:{hashlib.md5(title_key(title).encode()).hexdigest()}"
+
+    @staticmethod
+    def _usable_cached(cached) -> bool:
+        """只有命中结果和确定性未命中可以直接使用，临时错误需要重新请求"""
+        return bool(cached) and classify_error(cached.get('error')) != TRANSIENT
+
+    def _cached_doi(self, title: str) -> Optional[str]:
+        """只从缓存读取DOI，不发请求（对冲竞速结束时CrossRef查询可能仍未完成）"""
+        cached = self.cache.get(self._doi_cache_key(title))
+        return cached.get('doi') if self._usable_cached(cached) else None
+
     def _get_doi_from_title(self, title: str) -> Tuple[Optional[str], Optional[str]]:
         """返回 (DOI, 错误信息)"""
         # 检查缓存
-        cache_key = f"doi:{hashlib.md5(title.encode()).hexdigest()}"
+        cache_key = self._doi_cache_key(title)
         cached = self.cache.get(cache_key)
-        if cached:
+        if self._usable_cached(cached):
             return cached.get('doi'), cached.get('error')
 
         try:
-            search_url = self.crossref_api.format(title.replace(' ', '+'))
-            resp = self.session.get(search_url, timeout=15)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data['message']['items']:
-                    doi = data['message']['items'][0]['DOI']
-                    self.cache.set(cache_key, {'doi': doi, 'error': None})
-                    return doi, None
-
+            search_url = self.crossref_api.format(urllib.parse.quote_plus(title))
+            with self.scheduler.slot(search_url), self.metrics.timer('resolve', 'crossref'):
+                resp = self.session.get(search_url, timeout=15)
+            self.scheduler.observe(search_url, resp.status_code, resp.headers)
+            if resp.status_code in (429, 503):
+                return None, f"CrossRef限流 HTTP {resp.status_code}"  # 限流不写缓存
+            if resp.status_code != 200:
+                return None, f"CrossRef查询失败 HTTP {resp.status_code}"
+            data = resp.json()
+            if data['message']['items']:
+                doi = data['message']['items'][0]['DOI']
+                self.cache.set(cache_key, {'doi': doi, 'error': None})
+                return doi, None
+
+            # 只缓存确定性的未命中（使用负向TTL），临时错误不缓存
             self.cache.set(cache_key, {'doi': None, 'error': "未找到DOI"})
             return None, "未找到DOI"
         except Exception as e:
-            self.cache.set(cache_key, {'doi': None, 'error': f"CrossRef查询失败: {str(e)}"})
             return None, f"CrossRef查询失败: {str(e)}"
 
-    def _fetch_arxiv(self, title: str) -> Tuple[Optional[str], Optional[str]]:
+    def resolve_dois(self, titles: List[str], max_workers=8) -> Dict[str, Optional[str]]:
+        """批量并发解析DOI，结果写入缓存，返回 {标题: DOI}"""
+        doi_map = {}
+        groups = group_titles(titles, self.near_duplicate_threshold)
+        unique_titles = list(groups)
+        if not unique_titles:
+            return doi_map
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(
+                total=len(unique_titles),
+                desc="🔎 DOI解析进度",
+                unit="篇",
+                leave=False
+        ) as pbar:
+            future_to_title = {
+                executor.submit(self._get_doi_from_title, title): title
+                for title in unique_titles
+            }
+            for future in as_completed(future_to_title):
+                title = future_to_title[future]
+                try:
+                    doi_map[title], _ = future.result()
+                except Exception as e:
+                    logging.error(f"DOI解析出错: {title} | {str(e)}")
+                    doi_map[title] = None
+                pbar.update(1)
+
+        for title, members in groups.items():
+            for member in members[1:]:
+                doi_map[member] = doi_map[title]
+        found = sum(1 for doi in doi_map.values() if doi)
+        logging.info(f"DOI批量解析完成: {found}/{len(unique_titles)}")
+        return doi_map
+
+    @staticmethod
+    def _arxiv_pdf_link(entry) -> Optional[str]:
+        for link in entry.get('links', []):
+            if link.get('type') == 'application/pdf':
+                return link.href.replace('http:', 'https:', 1)
+        return None
+
+    def _match_arxiv_entry(self, title: str, entries) -> Optional[str]:
+        """在返回结果中找与标题最相似的条目，相似度不足时返回None"""
+        best_url, best_score = None, 0.0
+        for entry in entries:
+            score = title_similarity(title, entry.get('title', ''))
+            if score > best_score and (pdf_url := self._arxiv_pdf_link(entry)):
+                best_url, best_score = pdf_url, score
+        return best_url if best_score >= self.arxiv_match_threshold else None
+
+    def _query_arxiv(self, search_query: str, start=0, max_results=10):
+        with self.scheduler.slot(self.arxiv_api), self.metrics.timer('resolve', 'arxiv'):
+            resp = self.session.get(self.arxiv_api, params={
+                'search_query': search_query,
+                'start': start,
+                'max_results': max_results
+            }, timeout=30)
+        self.scheduler.observe(self.arxiv_api, resp.status_code, resp.headers)
+        resp.raise_for_status()
+        return feedparser.parse(resp.text)
+
+    def _fetch_arxiv(self, title: str, cancel: Optional[threading.Event] = None) -> Tuple[Optional[str], Optional[str]]:
         """返回 (PDF链接, 错误信息)"""
         # 检查缓存
-        cache_key = f"arxiv:{hashlib.md5(title.encode()).hexdigest()}"
+        cache_key = self._arxiv_cache_key(title)
         cached = self.cache.get(cache_key)
-        if cached:
+        if self._usable_cached(cached):
             return cached.get('url'), cached.get('error')
+        if cancel is not None and cancel.is_set():
+            return None, HEDGE_CANCELLED
 
         try:
-            search_url = self.arxiv_api.format(title.replace(' ', '+'))
-            resp = self.session.get(search_url, timeout=15)
-            feed = feedparser.parse(resp.text)
-            if feed.entries:
-                for link in feed.entries[0].links:
-                    if link.get('type') == 'application/pdf':
-                        pdf_url = link.href.replace('http:', 'https:', 1)
-                        self.cache.set(cache_key, {'url': pdf_url, 'error': None})
-                        return pdf_url, None
+            feed = self._query_arxiv(f"ti:{normalize_title(title)}", max_results=5)
+            if pdf_url := self._match_arxiv_entry(title, feed.entries):
+                self.cache.set(cache_key, {'url': pdf_url, 'error': None})
+                return pdf_url, None
 
             self.cache.set(cache_key, {'url': None, 'error': "未找到arXiv论文"})
             return None, "未找到arXiv论文"
         except Exception as e:
-            self.cache.set(cache_key, {'url': None, 'error': f"arXiv检索失败: {str(e)}"})
             return None, f"arXiv检索失败: {str(e)}"
 
-    def _fetch_scihub(self, search_param: str) -> Tuple[Optional[str], Optional[str]]:
-        """返回 (PDF链接, 错误信息)"""
+    def resolve_arxiv(self, titles: List[str], batch_size=20, page_size=100,
+                      max_pages=3) -> Dict[str, Optional[str]]:
+        """把多个标题合并为一个 ti:"..." OR 查询批量检索arXiv，本地按标题相似度匹配
+
+        命中与未命中都会写入缓存，返回 {标题: PDF链接}；检索结果超过 max_pages 页被截断时，
+        未匹配的标题既不缓存也不放入返回值，下载时由逐条检索兜底
+        """
+        url_map = {}
+        pending = []
+        groups = group_titles(titles, self.near_duplicate_threshold)
+        for title in groups:
+            cached = self.cache.get(self._arxiv_cache_key(title))
+            if self._usable_cached(cached):
+                url_map[title] = cached.get('url')
+            elif normalize_title(title):
+                pending.append(title)
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        for batch in tqdm(batches, desc="🔎 arXiv批量检索", unit="批", leave=False):
+            query = ' OR '.join(f'ti:"{normalize_title(title)}"' for title in batch)
+            entries = []
+            complete = False  # 是否取完了全部检索结果
+            try:
+                for page in range(max_pages):
+                    feed = self._query_arxiv(query, start=page * page_size, max_results=page_size)
+                    entries.extend(feed.entries)
+                    total = int(feed.feed.get('opensearch_totalresults', 0) or 0)
+                    if len(feed.entries) < page_size or len(entries) >= total:
+                        complete = True
+                        break
+            except Exception as e:
+                # 批量查询失败时不写缓存，留给逐条检索兜底
+                logging.warning(f"arXiv批量检索失败: {str(e)}")
+                continue
+            if not complete:
+                logging.debug(f"arXiv批量检索结果超过 {max_pages} 页，未匹配的标题留给逐条检索")
+
+            for title in batch:
+                cache_key = self._arxiv_cache_key(title)
+                pdf_url = self._match_arxiv_entry(title, entries)
+                if pdf_url:
+                    self.cache.set(cache_key, {'url': pdf_url, 'error': None})
+                elif complete:
+                    self.cache.set(cache_key, {'url': None, 'error': "未找到arXiv论文"})
+                else:
+                    # 结果被分页上限截断，未匹配不代表arXiv上没有，不缓存
+                    continue
+                url_map[title] = pdf_url
+
+        for title, members in groups.items():
+            for member in members[1:]:
+                if title in url_map:
+                    url_map[member] = url_map[title]
+        found = sum(1 for url in url_map.values() if url)
+        logging.info(f"arXiv批量检索完成: {found}/{len(url_map)}")
+        return url_map
+
+    def _fetch_scihub(self, search_param: str,
+                      cancel: Optional[threading.Event] = None) -> Tuple[Optional[str], Optional[str]]:
+        """返回 (PDF链接, 错误信息)；cancel 被设置时在下一个镜像请求之前放弃"""
         # 首先尝试已知工作的镜像
         all_mirrors = self.active_mirrors.copy() + [m for m in self.scihub_urls if m not in self.active_mirrors]
+        answered = False  # 是否有镜像正常返回了页面（只是没有PDF链接）
 
         for base_url in all_mirrors:
+            if cancel is not None and cancel.is_set():
+                return None, HEDGE_CANCELLED
             try:
                 search_url = f"{base_url}/{search_param}"
-                resp = self.session.get(search_url, timeout=20)
+                with self.scheduler.slot(search_url), self.metrics.timer('resolve', 'scihub'):
+                    resp = self.session.get(search_url, timeout=20)
+                self.scheduler.observe(search_url, resp.status_code, resp.headers)
                 if resp.status_code == 200:
                     soup = BeautifulSoup(resp.text, 'html.parser')
                     if pdf_url := self._parse_scihub_pdf_url(soup):
                         # 添加到活跃镜像列表
                         if base_url not in self.active_mirrors:
                             self.active_mirrors.append(base_url)
-
-                        if pdf_url.startswith('//'):
-                            return f"https:{pdf_url}", None
-                        if pdf_url.startswith('/'):
-                            return f"{base_url.rstrip('/')}{pdf_url}", None
-                        if not pdf_url.startswith(('http://', 'https://')):
-                            return f"{base_url.rstrip('/')}/{pdf_url.lstrip('/')}", None
-                        return pdf_url, None
+                        return self._absolute_pdf_url(base_url, pdf_url), None
+                    answered = True
                 elif resp.status_code == 403:
                     logging.warning(f"镜像 {base_url} 触发反爬机制")
 
             except Exception as e:
                 logging.debug(f"镜像 {base_url} 请求失败: {str(e)}")
 
-            # 短暂等待后继续尝试下一个镜像
-            time.sleep(random.uniform(0.5, 1.5))
+        return None, self._scihub_miss_error(answered)
 
-        return None, "所有镜像均失败"
+    @staticmethod
+    def _scihub_miss_error(answered: bool) -> str:
+        """镜像正常应答但页面中没有PDF链接是确定性的未命中；全部超时/出错/被拦截则是临时错误，可重试"""
+        return "镜像中未找到PDF链接" if answered else "所有镜像均失败"
+
+    @staticmethod
+    def _absolute_pdf_url(base_url: str, pdf_url: str) -> str:
+        """把镜像页面中的相对链接补全为绝对链接"""
+        if pdf_url.startswith('//'):
+            return f"https:{pdf_url}"
+        if pdf_url.startswith('/'):
+            return f"{base_url.rstrip('/')}{pdf_url}"
+        if not pdf_url.startswith(('http://', 'https://')):
+            return f"{base_url.rstrip('/')}/{pdf_url.lstrip('/')}"
+        return pdf_url
 
     def _parse_scihub_pdf_url(self, soup: BeautifulSoup) -> Optional[str]:
         try:
@@ -347,9 +1587,10 @@ class PaperDownloader:
     def _fetch_scihub_selenium(self, title: str) -> Tuple[Optional[str], Optional[str]]:
         """使用Selenium获取PDF链接"""
         try:
-            downloader = SciHubDownloader(headless=True)
-            pdf_url, error = downloader.fetch_pdf_url(title)
-            downloader.close()
+            with self.metrics.timer('resolve', 'selenium'):
+                downloader = SciHubDownloader(headless=True)
+                pdf_url, error = downloader.fetch_pdf_url(title)
+                downloader.close()
             return pdf_url, error
         except Exception as e:
             return None, f"Selenium获取失败: {str(e)}"
@@ -359,59 +1600,307 @@ class PaperDownloader:
 
         return None, "所有镜像均失败"
 
+    # ---------------- 断点续传 ----------------
+    # 下载先写入 save_path.part，旁边的 save_path.part.json 记录实际URL与ETag/Last-Modified，
+    # 校验通过后才原子重命名为 save_path，因此 save_path 存在即代表完整PDF
+
+    @staticmethod
+    def _part_paths(save_path: str) -> Tuple[str, str]:
+        part_path = f"{save_path}.part"
+        return part_path, f"{part_path}.json"
+
+    def _resume_state(self, url: str, save_path: str) -> Tuple[str, int, Dict[str, str]]:
+        """返回 (请求URL, 已下载字节数, 续传请求头)"""
+        part_path, meta_path = self._part_paths(save_path)
+        try:
+            offset = os.path.getsize(part_path)
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return url, 0, {}
+        if not offset or meta.get('url') != url:
+            return url, 0, {}
+
+        headers = {'Range': f'bytes={offset}-'}
+        etag = meta.get('etag')
+        if etag and not etag.startswith('W/'):  # 弱ETag不能用于If-Range
+            headers['If-Range'] = etag
+        elif meta.get('last_modified'):
+            headers['If-Range'] = meta['last_modified']
+        return meta.get('resolved_url') or url, offset, headers
+
+    def _save_part_meta(self, url: str, save_path: str, resolved_url: str, headers, total_size: int):
+        _, meta_path = self._part_paths(save_path)
+        meta = {
+            'url': url,
+            'resolved_url': resolved_url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'total_size': total_size,
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @staticmethod
+    def _write_offset(status: int, headers, offset: int) -> Tuple[Optional[int], int]:
+        """根据响应状态判断从哪里开始写入，返回 (写入偏移, 文件总大小)；偏移为None表示响应不可用"""
+        if status == 206:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != offset:
+                return None, 0
+            total = match.group(2)
+            return offset, int(total) if total != '*' else 0
+        if status == 200:
+            # 服务器不支持Range或文件已变化（If-Range不匹配），从头下载
+            total = 0 if headers.get('Content-Encoding') else int(headers.get('Content-Length', 0) or 0)
+            return 0, total
+        return None, 0
+
+    def _discard_part(self, save_path: str):
+        for path in self._part_paths(save_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _check_part(self, save_path: str, total_size: int) -> Tuple[bool, Optional[str]]:
+        """传输结束后对 .part 文件做廉价检查（大小与文件头），结构校验与重命名由 _finalize_part 完成"""
+        part_path, _ = self._part_paths(save_path)
+        size = os.path.getsize(part_path)
+        if total_size and size < total_size:
+            return False, f"下载不完整 {size}/{total_size} 字节"
+
+        with open(part_path, 'rb') as f:
+            header = f.read(100)
+        if not header.startswith(b'%PDF') and size < 10000:  # 文件太小，可能不是完整PDF
+            self._discard_part(save_path)
+            return False, "下载的文件不是有效的PDF"
+        return True, None
+
+    def _finalize_part(self, save_path: str, error: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """根据结构校验结果处理 .part 文件：通过则原子重命名为最终文件，
+        失败则删除 .part（内容已损坏，不能续传），返回False由调用方按临时错误重新下载"""
+        part_path, meta_path = self._part_paths(save_path)
+        if error is not None:
+            self.metrics.inc('validation_failures_total')
+            logging.warning(f"🧪 {error}: {os.path.basename(save_path)}")
+            self._discard_part(save_path)
+            return False, error
+
+        os.replace(part_path, save_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return True, None
+
     def _download_pdf(self, url: str, save_path: str) -> Tuple[bool, Optional[str]]:
+        # 整个传输过程占用目标主机的一个在途名额
+        with self.scheduler.slot(url), self.metrics.timer('transfer', HostScheduler.host_of(url)):
+            success, error = self._transfer_pdf(url, save_path)
+        if not success:
+            return success, error
+        # 结构校验在释放主机名额之后、重命名之前进行：不占用网络并发，最终文件名只会指向校验通过的文件。
+        # 校验期间当前下载线程阻塞等待结果，线程池的工作线程名额仍被占用
+        error = None
+        if self.validate_pdfs:
+            part_path, _ = self._part_paths(save_path)
+            with self.metrics.timer('validate', 'pdf'):
+                error = self._validator().submit(validate_pdf, part_path).result()
+        return self._finalize_part(save_path, error)
+
+    def _validator(self) -> ProcessPoolExecutor:
+        """PDF结构校验用的进程池，解析文件的CPU开销不占用下载线程的GIL
+
+        使用spawn方式启动子进程：下载线程、SQLite连接和日志队列线程运行时fork是不安全的
+        """
+        if self._validate_pool is None:
+            self._validate_pool = ProcessPoolExecutor(max_workers=self.validate_workers,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+        return self._validate_pool
+
+    def _warm_validator(self):
+        """提前启动校验子进程（spawn需要在子进程中重新导入模块），让启动开销与解析阶段重叠"""
+        if self.validate_pdfs:
+            self._validator().submit(os.getpid)
+
+    def _shutdown_pools(self):
+        """运行结束时关闭校验进程池（落选的对冲解析运行在守护线程中，已收到取消信号，不必等待）"""
+        if self._validate_pool is not None:
+            self._validate_pool.shutdown(wait=True)
+            self._validate_pool = None
+
+    def _transfer_pdf(self, url: str, save_path: str) -> Tuple[bool, Optional[str]]:
+        part_path, _ = self._part_paths(save_path)
         try:
             if url.startswith('//'):
                 url = f"https:{url}"
-            resp = self.session.get(url, stream=True, timeout=60)
-
-            # 检查是否为PDF
+            request_url, offset, range_headers = self._resume_state(url, save_path)
+            resp = self.session.get(request_url, headers=range_headers, stream=True, timeout=60)
+            self.scheduler.observe(request_url, resp.status_code, resp.headers)
+
+            if resp.status_code == 416 and offset:
+                # 请求范围越界，说明 .part 可能已经下载完整
+                resp.close()
+                if (ok := self._check_part(save_path, 0))[0]:
+                    return ok
+                self._discard_part(save_path)
+                return False, "续传失败 HTTP 416"
+
+            write_offset, total_size = self._write_offset(resp.status_code, resp.headers, offset)
+            if write_offset is None:
+                resp.close()  # 流式响应不读完就必须关闭，否则连接不会归还连接池
+                return False, f"下载失败 HTTP {resp.status_code}"
+
+            # 只用第一个分块嗅探文件头，非PDF立即中止，不把响应体读入内存（续传时开头已在之前校验过）
+            chunks = resp.iter_content(chunk_size=self.chunk_size)
+            first_chunk = next(chunks, b'')
             content_type = resp.headers.get('Content-Type', '')
-            if 'pdf' not in content_type.lower() and resp.content[:4] != b'%PDF':
+            if write_offset == 0 and 'pdf' not in content_type.lower() and first_chunk[:4] != b'%PDF':
+                resp.close()
+                self._discard_part(save_path)
                 return False, "下载内容不是PDF文件"
 
-            if resp.status_code == 200:
-                total_size = int(resp.headers.get('Content-Length', 0))
-
-                if total_size > 0:
-                    bar_format = "{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"
-                    desc = f"下载 {os.path.basename(save_path)[:20]}..."
-
-                    with open(save_path, 'wb') as f, tqdm(
-                            desc=desc,
-                            total=total_size,
-                            unit='B',
-                            unit_scale=True,
-                            bar_format=bar_format,
-                            leave=False
-                    ) as pbar:
-                        for chunk in resp.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                pbar.update(len(chunk))
-                else:
-                    with open(save_path, 'wb') as f:
-                        for chunk in resp.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-
-                # 检查PDF文件大小
-                if os.path.getsize(save_path) < 10000:  # 文件太小，可能不是完整PDF
-                    with open(save_path, 'rb') as f:
-                        content = f.read(100)
-                        if not content.startswith(b'%PDF'):
-                            os.remove(save_path)  # 删除无效文件
-                            return False, "下载的文件不是有效的PDF"
-
-                return True, None
-            return False, f"下载失败 HTTP {resp.status_code}"
+            self._save_part_meta(url, save_path, resp.url, resp.headers, total_size)
+            if write_offset:
+                logging.info(f"↪️ 从 {write_offset} 字节处续传: {os.path.basename(save_path)}")
+
+            bar_format = "{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}"
+            desc = f"下载 {os.path.basename(save_path)[:20]}..."
+            with open(part_path, 'ab' if write_offset else 'wb') as f, tqdm(
+                    desc=desc,
+                    total=total_size or None,
+                    initial=write_offset,
+                    unit='B',
+                    unit_scale=True,
+                    bar_format=bar_format,
+                    leave=False,
+                    disable=not total_size
+            ) as pbar:
+                f.write(first_chunk)
+                pbar.update(len(first_chunk))
+                written = len(first_chunk)
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        pbar.update(len(chunk))
+                        written += len(chunk)
+            self.metrics.inc('bytes_total', written, host=HostScheduler.host_of(request_url))
+
+            return self._check_part(save_path, total_size)
         except Exception as e:
-            if os.path.exists(save_path):
-                os.remove(save_path)  # 清理部分下载的文件
+            # 保留 .part 文件，下次重试或运行时续传
             return False, f"下载异常: {str(e)}"
 
+    def _link_from_store(self, title: str, doi: Optional[str], save_path: str) -> Optional[dict]:
+        """库中已有同一DOI/标题的文件时直接链接到保存路径，不产生任何下载"""
+        blob = self.store.lookup(doi=doi, title=title)
+        if not blob:
+            return None
+        self.store.link(blob, save_path)
+        self.store.record_title(title, doi, blob, save_path)
+        logging.info(f"♻️ 本地库已有该论文，直接链接: {title}")
+        return {
+            'title': title,
+            'status': '成功',
+            'method': '本地库',
+            'error': None,
+            'save_path': save_path,
+            'doi': doi
+        }
+
+    def _add_to_store(self, result: dict, doi: Optional[str]):
+        # 只有通过DOI下载的文件才能确定对应该DOI
+        file_doi = doi if result['method'] == 'Sci-Hub (DOI)' else None
+        try:
+            self.store.add(result['save_path'], doi=file_doi, title=result['title'])
+        except Exception as e:
+            logging.error(f"写入本地库失败: {result['save_path']} | {str(e)}")
+
     def download_by_title(self, title: str, save_path: str, retries=3) -> dict:
         """返回包含完整状态信息的字典"""
+        with self.metrics.busy():
+            if self.store is None:
+                return self._download_from_sources(title, save_path, retries)
+
+            if self.hedge_delay is not None:
+                # 对冲模式不在竞速前等待CrossRef：先按标题查库，按DOI查库放到竞速得到链接之后
+                with self.store.lock(title):
+                    if linked := self._link_from_store(title, None, save_path):
+                        return linked
+                    result = self._download_from_sources(title, save_path, retries)
+                    if result['status'] == '成功' and result['method'] != '本地库':
+                        self._add_to_store(result, self._cached_doi(title))
+                    return result
+
+            # 先解析DOI（通常已在预解析阶段缓存），同一DOI的任务串行执行
+            doi, _ = self._get_doi_from_title(title)
+            with self.store.lock(doi or title):
+                if linked := self._link_from_store(title, doi, save_path):
+                    return linked
+                result = self._download_from_sources(title, save_path, retries)
+                result['doi'] = doi
+                if result['status'] == '成功':
+                    self._add_to_store(result, doi)
+                return result
+
+    def _sources(self, title: str, cancel: Optional[threading.Event] = None) -> List[Tuple[str, Any]]:
+        """按优先级排列的来源；使用可延迟执行的函数，防止不必要的API调用
+
+        cancel 用于对冲解析：被设置后DOI/arXiv来源在发出下一个请求之前返回 HEDGE_CANCELLED
+        """
+        return [
+            ('Sci-Hub (DOI)', functools.partial(self._try_doi_fetch, title, cancel)),
+            ('arXiv', lambda: self._fetch_arxiv(title, cancel)),
+            ('Sci-Hub (Selenium)', lambda: self._fetch_scihub_selenium(title)),
+        ]
+
+    @staticmethod
+    def _start_hedged(fetcher) -> Future:
+        """在独立的守护线程中运行一个对冲来源
+
+        不使用共享线程池：落选的来源即使还在等待当前请求返回，也不会占用后续标题需要的线程，
+        运行结束时也不必等待它们
+        """
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fetcher())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='hedge', daemon=True).start()
+        return future
+
+    def _hedged_fetch(self, title: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """对冲解析，返回 (来源名, PDF链接, 错误信息)
+
+        先启动第一个来源，hedge_delay 秒内没有结果再启动下一个；任一来源给出链接即返回，
+        尚未开始的来源不再启动，已在运行的收到取消信号，在下一个请求之前放弃（已完成的请求结果仍会写入缓存）
+        """
+        cancel = threading.Event()
+        queued = [(name, fetcher) for name, fetcher in self._sources(title, cancel) if name in self.hedge_sources]
+        running = {}
+        last_error = None
+        while queued or running:
+            if queued:
+                name, fetcher = queued.pop(0)
+                running[self._start_hedged(fetcher)] = name
+            timeout = self.hedge_delay if queued else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    pdf_url, error = future.result()
+                except Exception as e:
+                    pdf_url, error = None, f"异常: {str(e)}"
+                if pdf_url:
+                    cancel.set()
+                    return name, pdf_url, None
+                last_error = error
+        return None, None, last_error
+
+    def _download_from_sources(self, title: str, save_path: str, retries=3) -> dict:
+        """依次尝试各来源下载"""
         result = {
             'title': title,
             'status': '失败',
@@ -421,16 +1910,25 @@ class PaperDownloader:
         }
 
         logging.info(f"🔍 开始处理: {title}")
+        source_classes = []  # 每个来源最终的错误类别
+
+        if self.hedge_delay is not None:
+            source_name, pdf_url, error = self._hedged_fetch(title)
+            if pdf_url and self.store is not None and (
+                    linked := self._link_from_store(title, self._cached_doi(title), save_path)):
+                return linked
+            if pdf_url:
+                logging.info(f"⬇️ 尝试下载: {pdf_url}")
+                success, error = self._download_pdf(pdf_url, save_path)
+                if success:
+                    result.update({'status': '成功', 'method': source_name, 'error': None})
+                    logging.info(f"✅ 下载成功: {title} via {source_name}")
+                    return result
+            # 对冲未能完成下载时回退到按顺序尝试（已完成的解析会命中缓存）
+            result['error'] = error
 
         # 尝试不同来源
-        # 使用可延迟执行的函数，防止不必要的API调用
-        sources = [
-            ('Sci-Hub (DOI)', functools.partial(self._try_doi_fetch, title)),
-            ('arXiv', lambda: self._fetch_arxiv(title)),
-            ('Sci-Hub (Selenium)', lambda: self._fetch_scihub_selenium(title)),
-        ]
-
-        for source_name, fetcher in sources:
+        for source_name, fetcher in self._sources(title):
             for attempt in range(retries):
                 try:
                     logging.debug(f"尝试来源: {source_name} (第{attempt + 1}次重试)")
@@ -439,67 +1937,222 @@ class PaperDownloader:
                     if not pdf_url:
                         result['error'] = error
                         logging.warning(f"❓ {source_name} 未找到资源: {error}")
-                        continue
-
-                    # 执行下载
-                    logging.info(f"⬇️ 尝试下载: {pdf_url}")
-                    success, dl_error = self._download_pdf(pdf_url, save_path)
-                    if success:
-                        result.update({
-                            'status': '成功',
-                            'method': source_name,
-                            'error': None
-                        })
-                        logging.info(f"✅ 下载成功: {title} via {source_name}")
-                        return result
-
-                    result['error'] = dl_error
-                    logging.warning(f"⚠️ 下载失败: {dl_error}")
+                    else:
+                        # 执行下载
+                        logging.info(f"⬇️ 尝试下载: {pdf_url}")
+                        success, dl_error = self._download_pdf(pdf_url, save_path)
+                        if success:
+                            result.update({
+                                'status': '成功',
+                                'method': source_name,
+                                'error': None
+                            })
+                            logging.info(f"✅ 下载成功: {title} via {source_name}")
+                            return result
+
+                        result['error'] = dl_error
+                        logging.warning(f"⚠️ 下载失败: {dl_error}")
 
                 except Exception as e:
                     error_msg = f"异常: {str(e)}"
                     result['error'] = error_msg
                     logging.error(f"🔥 发生异常: {error_msg}")
 
-                # 智能退避
-                delay = min(2 ** attempt, 10)  # 指数退避最大10秒
-                time.sleep(delay)
-
+                # 按错误类别退避：确定性失败直接换下一个来源，限流由调度器等待，临时错误指数退避
+                delay = retry_delay(result['error'], attempt)
+                if delay is None:
+                    break
+                if attempt + 1 < retries:
+                    self.metrics.inc('retries_total', source=source_name)
+                    with self.metrics.timer('sleep', source_name):
+                        time.sleep(delay)
+            source_classes.append(classify_error(result['error']))
+
+        result['error_class'] = worst_error_class(source_classes)
         if result['status'] == '失败':
             logging.error(f"❌ 最终失败: {title} | 错误: {result.get('error', '未知错误')}")
         return result
 
-    def _try_doi_fetch(self, title):
+    def _try_doi_fetch(self, title, cancel: Optional[threading.Event] = None):
         """先获取DOI再尝试Sci-Hub"""
+        if cancel is not None and cancel.is_set():
+            return None, HEDGE_CANCELLED
         doi, error = self._get_doi_from_title(title)
         if doi:
-            return self._fetch_scihub(doi)
+            return self._fetch_scihub(doi, cancel)
         return None, error or "未找到DOI"
 
-    def download_papers(self, titles: List[str], save_dir: str) -> Dict[str, int]:
-        """使用线程池并行下载多篇论文"""
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir, exist_ok=True)
-
-        total = len(titles)
-        stats = {'success': 0, 'fail': 0, 'skipped': 0}
-        results = []
+    @staticmethod
+    def _save_path_for(title: str, save_dir: str) -> str:
+        safe_title = re.sub(r'[\\/*?:"<>|]', '_', title)
+        if len(safe_title) > 100:
+            # 截断后加上完整标题的哈希，避免前缀相同的长标题互相覆盖
+            safe_title = f"{safe_title[:100]}_{hashlib.md5(title.encode()).hexdigest()[:8]}"
+        return os.path.join(save_dir, f"{safe_title}.pdf")
+
+    @staticmethod
+    def _legacy_save_path_for(title: str, save_dir: str) -> Optional[str]:
+        """旧版本对长标题只截断不加哈希的保存路径；标题不超过100个字符时两者相同，返回None"""
+        safe_title = re.sub(r'[\\/*?:"<>|]', '_', title)
+        if len(safe_title) <= 100:
+            return None
+        return os.path.join(save_dir, f"{safe_title[:100]}.pdf")
+
+    def _adopt_existing(self, title: str, save_path: str) -> bool:
+        """保存路径上已有文件时返回True
+
+        旧版本按截断标题命名的长标题文件也算已有：启用本地库时入库并链接到新路径，否则改名为新路径
+        """
+        if os.path.exists(save_path):
+            return True
+        legacy_path = self._legacy_save_path_for(title, os.path.dirname(save_path))
+        if legacy_path is None or not os.path.exists(legacy_path):
+            return False
+        try:
+            if self.store is not None:
+                with self.store.lock(title):
+                    blob = self.store.add(legacy_path, title=title)
+                    self.store.link(blob, save_path)
+                    self.store.record_title(title, None, blob, save_path)
+            else:
+                os.replace(legacy_path, save_path)
+        except Exception as e:
+            logging.error(f"采用旧文件名的文件失败: {legacy_path} | {str(e)}")
+            return False
+        logging.info(f"♻️ 采用旧文件名下已有的文件: {legacy_path} -> {save_path}")
+        return True
+
+    @staticmethod
+    def _skipped_result(title: str, save_path: str) -> dict:
+        return {
+            'title': title,
+            'status': '跳过',
+            'method': None,
+            'error': '文件已存在',
+            'save_path': save_path
+        }
 
-        # 初始化结果记录文件
-        result_csv = 'download_results.csv'
+    @staticmethod
+    def _open_result_csv(result_csv='download_results.csv', append=False):
+        """初始化结果记录文件，返回 (文件对象, DictWriter)；append=True 时保留已有结果（续跑）"""
         fieldnames = ['title', 'status', 'method', 'error', 'save_path']
 
-        if not os.path.exists(result_csv):
+        if not (append and os.path.exists(result_csv)):
+            # 新建或清空结果文件并写入表头
             with open(result_csv, 'w', newline='', encoding='utf-8-sig') as f:
                 writer = csv.DictWriter(f, fieldnames=fieldnames)
                 writer.writeheader()
-        else:
-            with open(result_csv, 'w', encoding='utf-8-sig') as f:
-                pass  # 打开文件并立即关闭以清空内容
 
         # 创建结果记录对象
         result_file = open(result_csv, 'a', newline='', encoding='utf-8-sig')
-        result_writer = csv.DictWriter(result_file, fieldnames=fieldnames)
+        # 结果字典中的 error_class 等内部字段只写入运行日志，不写入CSV
+        return result_file, csv.DictWriter(result_file, fieldnames=fieldnames, extrasaction='ignore')
+
+    def _record(self, result_writer, result: dict):
+        """写一行结果CSV，并同步更新运行日志；被合并的重复标题各写一行，结果与代表标题相同
+
+        结果中没有带DOI时（未启用本地库或DOI在来源内部解析）从缓存补上，运行日志按标题/DOI记录
+        """
+        self.metrics.inc('titles_total', status=result['status'], method=result.get('method') or '')
+        if not result.get('doi'):
+            result = {**result, 'doi': self._cached_doi(result['title'])}
+        for title in [result['title'], *self._duplicates.get(result['title'], ())]:
+            row = result if title == result['title'] else {**result, 'title': title}
+            result_writer.writerow(row)
+            if self.journal is not None:
+                self.journal.record(row)
+            logging.info(f"结果: {row['status']} | {title}", extra={'event': 'result', **row})
+
+    @contextlib.contextmanager
+    def _metrics_run(self, workers: int):
+        """一次下载运行的指标窗口：开始计时、按需启动 /metrics 端点，结束时导出；调用方把统计结果放入 run['stats']"""
+        self.metrics.start(workers)
+        metrics_server = self.metrics.serve(self.metrics_port) if self.metrics_port is not None else None
+        run = {'stats': None}
+        try:
+            yield run
+        finally:
+            self.metrics.stop()
+            self._export_metrics(run['stats'])
+            if metrics_server is not None:
+                metrics_server.shutdown()
+
+    def download_papers(self, titles: Iterable[str], save_dir: str, engine='thread', resume=False) -> Dict[str, int]:
+        """并行下载多篇论文
+
+        engine='thread' 使用线程池；engine='async' 使用asyncio事件循环（需安装aiohttp）；
+        engine='pipeline' 把解析与下载拆成两个独立线程池的流水线；
+        engine='stream' 逐个读取标题（可以是生成器），只保持有限个在途任务，适合超大输入。
+        resume=True 时根据运行日志只处理未完成或可重试失败的标题，并在已有结果CSV后追加
+        """
+        if engine == 'stream':
+            return self.download_papers_streaming(titles, save_dir, resume=resume)
+
+        titles = list(titles)
+        self.journal = RunJournal(self.journal_file)
+        self._append_results = resume
+        resumed = 0
+        if resume:
+            finished = self.journal.finished_titles()
+            remaining = [title for title in titles if title not in finished]
+            resumed = len(titles) - len(remaining)
+            titles = remaining
+            logging.info(f"↪️ 续跑模式：跳过已完成 {resumed} 篇，剩余 {len(titles)} 篇")
+
+        # 在任何网络请求之前合并重复标题，只处理每组的代表标题
+        groups = group_titles(titles, self.near_duplicate_threshold)
+        self._duplicates = {title: members[1:] for title, members in groups.items() if len(members) > 1}
+        duplicates = sum(len(members) for members in self._duplicates.values())
+        if duplicates:
+            logging.info(f"🔁 合并重复标题 {duplicates} 个，实际处理 {len(groups)} 篇")
+        titles = list(groups)
+        self.journal.mark_pending(titles)
+        self._warm_validator()
+
+        # 利用率按实际并发的工作者数计算：流水线为解析+下载两组线程
+        workers = {
+            'async': min(self.max_concurrency, max(1, len(titles))),
+            'pipeline': 2 * self.max_workers,
+        }.get(engine, self.max_workers)
+        try:
+            with self._metrics_run(workers) as run:
+                if engine == 'async':
+                    stats = asyncio.run(self.download_papers_async(titles, save_dir))
+                elif engine == 'pipeline':
+                    stats = self.download_papers_pipeline(titles, save_dir)
+                else:
+                    stats = self._download_papers_threaded(titles, save_dir)
+                stats['skipped'] += resumed
+                stats['duplicates'] = duplicates
+                run['stats'] = stats
+        finally:
+            self.journal.close()
+            self._shutdown_pools()
+        return stats
+
+    def _export_metrics(self, stats: Optional[Dict[str, int]]):
+        """写出本次运行的指标摘要，并作为结构化事件写入日志"""
+        try:
+            self.metrics.write(self.metrics_file, self.prometheus_file, stats)
+        except OSError as e:
+            logging.error(f"写出运行指标失败: {str(e)}")
+        summary = self.metrics.summary(stats)
+        logging.info(
+            f"📈 运行指标: 用时 {summary['elapsed_seconds']}s | 利用率 {summary['worker_utilization']} | "
+            f"缓存命中率 {summary['cache_hit_rate']}",
+            extra={'event': 'run_summary', 'summary': summary}
+        )
+
+    def _download_papers_threaded(self, titles: List[str], save_dir: str) -> Dict[str, int]:
+        """使用线程池并行下载多篇论文"""
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir, exist_ok=True)
+        self.store = PdfStore(save_dir, self.store_manifest) if self.use_store else None
+
+        total = len(titles)
+        stats = {'success': 0, 'fail': 0, 'skipped': 0}
+
+        result_file, result_writer = self._open_result_csv(self.result_csv, append=self._append_results)
 
         with tqdm(
                 total=total,
@@ -512,19 +2165,11 @@ class PaperDownloader:
                 future_to_title = {}
 
                 for title in titles:
-                    safe_title = re.sub(r'[\\/*?:"<>|]', '_', title)[:100]
-                    save_path = os.path.join(save_dir, f"{safe_title}.pdf")
+                    save_path = self._save_path_for(title, save_dir)
 
                     # 检查文件是否存在
-                    if os.path.exists(save_path):
-                        result = {
-                            'title': title,
-                            'status': '跳过',
-                            'method': None,
-                            'error': '文件已存在',
-                            'save_path': save_path
-                        }
-                        result_writer.writerow(result)
+                    if self._adopt_existing(title, save_path):
+                        self._record(result_writer, self._skipped_result(title, save_path))
                         stats['skipped'] += 1
                         pbar.update(1)
                         pbar.set_postfix(stats, refresh=True)
@@ -545,7 +2190,7 @@ class PaperDownloader:
                             stats['fail'] += 1
 
                         # 记录结果
-                        result_writer.writerow(result)
+                        self._record(result_writer, result)
                         result_file.flush()  # 立即写入磁盘
 
                     except Exception as e:
@@ -559,43 +2204,850 @@ class PaperDownloader:
         result_file.close()
         return stats
 
+    # ---------------- 流式处理 ----------------
+
+    def _stream_task(self, title: str, save_dir: str) -> dict:
+        """流式模式的单个任务：文件是否已存在的检查也放在工作线程中进行"""
+        save_path = self._save_path_for(title, save_dir)
+        try:
+            if self._adopt_existing(title, save_path):
+                return self._skipped_result(title, save_path)
+            return self.download_by_title(title, save_path)
+        except Exception as e:
+            logging.error(f"处理任务时出错: {title} | {str(e)}")
+            return {'title': title, 'status': '失败', 'method': None, 'error': f"异常: {str(e)}",
+                    'save_path': save_path}
+
+    def download_papers_streaming(self, titles: Iterable[str], save_dir: str, resume=False,
+                                  window=None) -> Dict[str, int]:
+        """流式下载：边读取标题边提交，同时在途的任务不超过 window 个，每完成一个立即写出结果
+
+        不预先读入全部标题、不预先检查文件，启动无需等待，内存占用与输入规模无关。
+        不做整体的重复标题合并：重复标题会命中按归一化标题存取的缓存和本地库，不会重复下载
+        """
+        window = window or self.max_workers * 4
+        os.makedirs(save_dir, exist_ok=True)
+        self.store = PdfStore(save_dir, self.store_manifest) if self.use_store else None
+        self.journal = RunJournal(self.journal_file)
+        self._duplicates = {}
+        self._warm_validator()
+        stats = {'success': 0, 'fail': 0, 'skipped': 0}
+        result_file, result_writer = self._open_result_csv(self.result_csv, append=resume)
+
+        def collect(done, pbar):
+            for future in done:
+                result = future.result()  # _stream_task 不会抛出异常
+                if result['status'] == '成功':
+                    stats['success'] += 1
+                elif result['status'] == '跳过':
+                    stats['skipped'] += 1
+                else:
+                    stats['fail'] += 1
+                self._record(result_writer, result)
+                pbar.update(1)
+            result_file.flush()
+            pbar.set_postfix(stats, refresh=False)
+
+        try:
+            with self._metrics_run(self.max_workers) as run, \
+                    ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                    tqdm(desc="📥 论文下载进度", unit="篇",
+                         bar_format="{l_bar}{n_fmt} [已用:{elapsed}, {rate_fmt}]") as pbar:
+                in_flight = set()
+                for title in titles:
+                    if resume and self.journal.is_finished(title):
+                        stats['skipped'] += 1
+                        continue
+                    if len(in_flight) >= window:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done, pbar)
+                    self.journal.mark_pending([title])
+                    in_flight.add(executor.submit(self._stream_task, title, save_dir))
+
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done, pbar)
+                run['stats'] = stats
+        finally:
+            result_file.close()
+            self.journal.close()
+            self._shutdown_pools()
+        return stats
+
+    # ---------------- 解析/下载两阶段流水线 ----------------
+
+    def _resolve_item(self, item: dict, retries=3) -> dict:
+        """从 item['source_idx'] 开始依次尝试来源，直到得到候选PDF链接
+
+        与按顺序下载相同，每个来源按错误类别重试：只有确定性失败或重试次数用尽才换下一个来源
+        """
+        sources = self._sources(item['title'])
+        item['url'] = None
+        while item['source_idx'] < len(sources):
+            source_name, fetcher = sources[item['source_idx']]
+            for attempt in range(retries):
+                try:
+                    pdf_url, error = fetcher()
+                except Exception as e:
+                    pdf_url, error = None, f"异常: {str(e)}"
+                if pdf_url:
+                    item.update({'method': source_name, 'url': pdf_url})
+                    return item
+                item['error'] = error
+                logging.warning(f"❓ {source_name} 未找到资源: {error}")
+                delay = retry_delay(error, attempt)
+                if delay is None:
+                    break
+                if attempt + 1 < retries:
+                    self.metrics.inc('retries_total', source=source_name)
+                    with self.metrics.timer('sleep', source_name):
+                        time.sleep(delay)
+            item.setdefault('error_classes', []).append(classify_error(item['error']))
+            item['source_idx'] += 1
+        return item
+
+    def _pipeline_result(self, item: dict, status: str) -> dict:
+        return {
+            'title': item['title'],
+            'status': status,
+            'method': item.get('method') if status == '成功' else None,
+            'error': None if status == '成功' else item.get('error'),
+            'error_class': None if status == '成功' else worst_error_class(item.get('error_classes') or [classify_error(item.get('error'))]),
+            'save_path': item['save_path'],
+            'doi': item.get('doi')
+        }
+
+    def download_papers_pipeline(self, titles: List[str], save_dir: str,
+                                 resolve_workers=None, download_workers=None,
+                                 manifest_file=None, retries=3) -> Dict[str, int]:
+        """两阶段流水线：解析线程把标题解析为候选链接写入清单，下载线程从有界队列中取链接下载
+
+        两个阶段的并发数各自独立；下载失败时把任务退回解析阶段尝试下一个来源；
+        再次运行时清单里已解析的链接直接进入下载阶段
+        """
+        resolve_workers = resolve_workers or self.max_workers
+        download_workers = download_workers or self.max_workers
+        os.makedirs(save_dir, exist_ok=True)
+        self.store = PdfStore(save_dir, self.store_manifest) if self.use_store else None
+
+        stats = {'success': 0, 'fail': 0, 'skipped': 0}
+        result_file, result_writer = self._open_result_csv(self.result_csv, append=self._append_results)
+        manifest = ResolveManifest(manifest_file or self.manifest_file)
+        resolved = manifest.load()
+
+        download_queue = queue.Queue(maxsize=download_workers * 4)
+        result_queue = queue.Queue()
+        resolve_pool = ThreadPoolExecutor(max_workers=resolve_workers, thread_name_prefix='resolve')
+
+        def resolve_stage(item):
+            with self.metrics.busy():
+                try:
+                    if self.store is not None and item['source_idx'] == 0:
+                        doi, _ = self._get_doi_from_title(item['title'])
+                        item['doi'] = doi
+                        if linked := self._link_from_store(item['title'], doi, item['save_path']):
+                            result_queue.put(linked)
+                            return
+                    self._resolve_item(item, retries)
+                    manifest.append({
+                        'title': item['title'],
+                        'save_path': item['save_path'],
+                        'source_idx': item['source_idx'],
+                        'method': item.get('method'),
+                        'url': item['url'],
+                        'doi': item.get('doi'),
+                        'error': item.get('error'),
+                        'error_classes': item.get('error_classes'),
+                        'ts': time.time()
+                    })
+                    if item['url']:
+                        download_queue.put(item)  # 队列满时阻塞，形成背压
+                    else:
+                        result_queue.put(self._pipeline_result(item, '失败'))
+                except Exception as e:
+                    item['error'] = f"异常: {str(e)}"
+                    item.setdefault('error_classes', []).append(TRANSIENT)
+                    result_queue.put(self._pipeline_result(item, '失败'))
+
+        def download_stage():
+            while (item := download_queue.get()) is not None:
+                with self.metrics.busy():
+                    try:
+                        lock = self.store.lock(item.get('doi') or item['title']) if self.store else contextlib.nullcontext()
+                        with lock:
+                            if self.store is not None and (
+                                    linked := self._link_from_store(item['title'], item.get('doi'), item['save_path'])):
+                                result_queue.put(linked)
+                                continue
+                            success = False
+                            for attempt in range(retries):
+                                logging.info(f"⬇️ 尝试下载: {item['url']}")
+                                success, dl_error = self._download_pdf(item['url'], item['save_path'])
+                                if success:
+                                    break
+                                item['error'] = dl_error
+                                logging.warning(f"⚠️ 下载失败: {dl_error}")
+                                delay = retry_delay(dl_error, attempt)
+                                if delay is None:
+                                    break
+                                if attempt + 1 < retries:
+                                    self.metrics.inc('retries_total', source=item['method'])
+                                    with self.metrics.timer('sleep', item['method']):
+                                        time.sleep(delay)
+                            if success:
+                                result = self._pipeline_result(item, '成功')
+                                if self.store is not None:
+                                    self._add_to_store(result, item.get('doi'))
+                                logging.info(f"✅ 下载成功: {item['title']} via {item['method']}")
+                                result_queue.put(result)
+                                continue
+                        # 当前来源的链接不可用，退回解析阶段尝试下一个来源
+                        item.setdefault('error_classes', []).append(classify_error(item.get('error')))
+                        item['source_idx'] += 1
+                        resolve_pool.submit(resolve_stage, item)
+                    except Exception as e:
+                        item['error'] = f"异常: {str(e)}"
+                        item.setdefault('error_classes', []).append(TRANSIENT)
+                        result_queue.put(self._pipeline_result(item, '失败'))
+
+        downloaders = [
+            threading.Thread(target=download_stage, name=f'download-{i}', daemon=True)
+            for i in range(download_workers)
+        ]
+        for thread in downloaders:
+            thread.start()
+
+        with tqdm(
+                total=len(titles),
+                desc="📥 论文下载进度",
+                unit="篇",
+                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [已用:{elapsed}<剩余:{remaining}]"
+        ) as pbar:
+            pending = 0
+            ready = []  # 清单中已解析的任务，直接进入下载阶段
+            for title in titles:
+                save_path = self._save_path_for(title, save_dir)
+                if self._adopt_existing(title, save_path):
+                    self._record(result_writer, self._skipped_result(title, save_path))
+                    stats['skipped'] += 1
+                    pbar.update(1)
+                    continue
+
+                item = {'title': title, 'save_path': save_path, 'source_idx': 0}
+                record = resolved.get(title)
+                if record and record.get('url'):
+                    item.update({key: record.get(key) for key in ('source_idx', 'method', 'url', 'doi', 'error_classes')})
+                    ready.append(item)
+                else:
+                    resolve_pool.submit(resolve_stage, item)
+                pending += 1
+
+            # 下载队列有界，由单独线程喂入，避免阻塞结果收集
+            threading.Thread(target=lambda: [download_queue.put(item) for item in ready], daemon=True).start()
+
+            while pending:
+                result = result_queue.get()
+                pending -= 1
+                if result['status'] == '成功':
+                    stats['success'] += 1
+                else:
+                    stats['fail'] += 1
+                    logging.error(f"❌ 最终失败: {result['title']} | 错误: {result.get('error', '未知错误')}")
+                self._record(result_writer, result)
+                result_file.flush()
+                pbar.update(1)
+                pbar.set_postfix(stats, refresh=True)
+
+        for _ in downloaders:
+            download_queue.put(None)
+        resolve_pool.shutdown(wait=True)
+        result_file.close()
+        return stats
+
+    # ---------------- 异步下载引擎 ----------------
+    # 事件循环中不做阻塞的文件读写和SQLite访问（缓存、本地库、.part 文件、结果记录），统一交给 _run_io 的线程池
+
+    async def _run_io(self, func, *args):
+        """在I/O线程池中执行阻塞的文件/SQLite操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, functools.partial(func, *args))
+
+    async def _aget_doi_from_title(self, http, title: str) -> Tuple[Optional[str], Optional[str]]:
+        """_get_doi_from_title 的异步版本"""
+        cache_key = self._doi_cache_key(title)
+        cached = await self._run_io(self.cache.get, cache_key)
+        if self._usable_cached(cached):
+            return cached.get('doi'), cached.get('error')
+
+        try:
+            search_url = self.crossref_api.format(urllib.parse.quote_plus(title))
+            async with self.scheduler.aslot(search_url), self.metrics.timer('resolve', 'crossref'), \
+                    http.get(search_url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                self.scheduler.observe(search_url, resp.status, resp.headers)
+                if resp.status in (429, 503):
+                    return None, f"CrossRef限流 HTTP {resp.status}"
+                if resp.status != 200:
+                    return None, f"CrossRef查询失败 HTTP {resp.status}"
+                data = await resp.json(content_type=None)
+                if data['message']['items']:
+                    doi = data['message']['items'][0]['DOI']
+                    await self._run_io(self.cache.set, cache_key, {'doi': doi, 'error': None})
+                    return doi, None
+
+            await self._run_io(self.cache.set, cache_key, {'doi': None, 'error': "未找到DOI"})
+            return None, "未找到DOI"
+        except Exception as e:
+            return None, f"CrossRef查询失败: {str(e)}"
+
+    async def _afetch_arxiv(self, http, title: str) -> Tuple[Optional[str], Optional[str]]:
+        """_fetch_arxiv 的异步版本"""
+        cache_key = self._arxiv_cache_key(title)
+        cached = await self._run_io(self.cache.get, cache_key)
+        if self._usable_cached(cached):
+            return cached.get('url'), cached.get('error')
+
+        try:
+            params = {'search_query': f"ti:{normalize_title(title)}", 'start': 0, 'max_results': 5}
+            async with self.scheduler.aslot(self.arxiv_api), self.metrics.timer('resolve', 'arxiv'), \
+                    http.get(self.arxiv_api, params=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                self.scheduler.observe(self.arxiv_api, resp.status, resp.headers)
+                resp.raise_for_status()
+                feed = feedparser.parse(await resp.text())
+            if pdf_url := self._match_arxiv_entry(title, feed.entries):
+                await self._run_io(self.cache.set, cache_key, {'url': pdf_url, 'error': None})
+                return pdf_url, None
+
+            await self._run_io(self.cache.set, cache_key, {'url': None, 'error': "未找到arXiv论文"})
+            return None, "未找到arXiv论文"
+        except Exception as e:
+            return None, f"arXiv检索失败: {str(e)}"
+
+    async def _afetch_scihub(self, http, search_param: str) -> Tuple[Optional[str], Optional[str]]:
+        """_fetch_scihub 的异步版本"""
+        all_mirrors = self.active_mirrors.copy() + [m for m in self.scihub_urls if m not in self.active_mirrors]
+        answered = False
+
+        for base_url in all_mirrors:
+            try:
+                search_url = f"{base_url}/{search_param}"
+                async with self.scheduler.aslot(search_url), self.metrics.timer('resolve', 'scihub'), \
+                        http.get(search_url, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+                    self.scheduler.observe(search_url, resp.status, resp.headers)
+                    if resp.status == 200:
+                        soup = BeautifulSoup(await resp.text(errors='replace'), 'html.parser')
+                        if pdf_url := self._parse_scihub_pdf_url(soup):
+                            if base_url not in self.active_mirrors:
+                                self.active_mirrors.append(base_url)
+                            return self._absolute_pdf_url(base_url, pdf_url), None
+                        answered = True
+                    elif resp.status == 403:
+                        logging.warning(f"镜像 {base_url} 触发反爬机制")
+
+            except Exception as e:
+                logging.debug(f"镜像 {base_url} 请求失败: {str(e)}")
+
+        return None, self._scihub_miss_error(answered)
+
+    async def _atry_doi_fetch(self, http, title):
+        doi, error = await self._aget_doi_from_title(http, title)
+        if doi:
+            return await self._afetch_scihub(http, doi)
+        return None, error or "未找到DOI"
+
+    async def _afetch_scihub_selenium(self, title):
+        # Selenium是阻塞的且很重，放到线程中并限制同时运行的浏览器数量
+        async with self._selenium_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._fetch_scihub_selenium, title)
+
+    async def _adownload_pdf(self, http, url: str, save_path: str) -> Tuple[bool, Optional[str]]:
+        """_download_pdf 的异步版本，同样支持 .part 断点续传"""
+        async with self.scheduler.aslot(url), self.metrics.timer('transfer', HostScheduler.host_of(url)):
+            success, error = await self._atransfer_pdf(http, url, save_path)
+        if not success:
+            return success, error
+        error = None
+        if self.validate_pdfs:
+            loop = asyncio.get_running_loop()
+            part_path, _ = self._part_paths(save_path)
+            with self.metrics.timer('validate', 'pdf'):
+                error = await loop.run_in_executor(self._validator(), validate_pdf, part_path)
+        return await self._run_io(self._finalize_part, save_path, error)
+
+    async def _atransfer_pdf(self, http, url: str, save_path: str) -> Tuple[bool, Optional[str]]:
+        part_path, _ = self._part_paths(save_path)
+        try:
+            if url.startswith('//'):
+                url = f"https:{url}"
+            request_url, offset, range_headers = await self._run_io(self._resume_state, url, save_path)
+            async with http.get(request_url, headers=range_headers,
+                                timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as resp:
+                self.scheduler.observe(request_url, resp.status, resp.headers)
+                if resp.status == 416 and offset:
+                    if (ok := await self._run_io(self._check_part, save_path, 0))[0]:
+                        return ok
+                    await self._run_io(self._discard_part, save_path)
+                    return False, "续传失败 HTTP 416"
+
+                write_offset, total_size = self._write_offset(resp.status, resp.headers, offset)
+                if write_offset is None:
+                    return False, f"下载失败 HTTP {resp.status}"
+
+                first_chunk = await resp.content.read(self.chunk_size)
+                content_type = resp.headers.get('Content-Type', '')
+                if write_offset == 0 and 'pdf' not in content_type.lower() and first_chunk[:4] != b'%PDF':
+                    await self._run_io(self._discard_part, save_path)
+                    return False, "下载内容不是PDF文件"
+
+                await self._run_io(self._save_part_meta, url, save_path, str(resp.url), resp.headers, total_size)
+                f = await self._run_io(open, part_path, 'ab' if write_offset else 'wb')
+                try:
+                    await self._run_io(f.write, first_chunk)
+                    written = len(first_chunk)
+                    async for chunk in resp.content.iter_chunked(self.chunk_size):
+                        await self._run_io(f.write, chunk)
+                        written += len(chunk)
+                finally:
+                    await self._run_io(f.close)
+                self.metrics.inc('bytes_total', written, host=HostScheduler.host_of(request_url))
+
+            return await self._run_io(self._check_part, save_path, total_size)
+        except Exception as e:
+            return False, f"下载异常: {str(e) or type(e).__name__}"
+
+    @contextlib.asynccontextmanager
+    async def _store_lock(self, key: str):
+        """PdfStore.lock 的异步版本：同一DOI/标题的下载串行化，锁按引用计数保存，最后一个持有者释放后即删除"""
+        entry = self._store_locks.get(key)
+        if entry is None:
+            entry = self._store_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._store_locks[key]
+
+    async def adownload_by_title(self, http, title: str, save_path: str, retries=3) -> dict:
+        """download_by_title 的异步版本，返回相同结构的结果字典"""
+        with self.metrics.busy():
+            if self.store is None:
+                return await self._adownload_from_sources(http, title, save_path, retries)
+
+            if self.hedge_delay is not None:
+                # 与 download_by_title 相同：对冲模式下按DOI查库放到竞速得到链接之后
+                async with self._store_lock(title):
+                    if linked := await self._run_io(self._link_from_store, title, None, save_path):
+                        return linked
+                    result = await self._adownload_from_sources(http, title, save_path, retries)
+                    if result['status'] == '成功' and result['method'] != '本地库':
+                        doi = await self._run_io(self._cached_doi, title)
+                        await self._run_io(self._add_to_store, result, doi)
+                    return result
+
+            doi, _ = await self._aget_doi_from_title(http, title)
+            async with self._store_lock(doi or title):
+                if linked := await self._run_io(self._link_from_store, title, doi, save_path):
+                    return linked
+                result = await self._adownload_from_sources(http, title, save_path, retries)
+                result['doi'] = doi
+                if result['status'] == '成功':
+                    await self._run_io(self._add_to_store, result, doi)
+                return result
+
+    async def _ahedged_fetch(self, sources) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """_hedged_fetch 的异步版本，落选的任务会被取消"""
+        queued = [(name, fetcher) for name, fetcher in sources if name in self.hedge_sources]
+        running = {}
+        last_error = None
+        try:
+            while queued or running:
+                if queued:
+                    name, fetcher = queued.pop(0)
+                    running[asyncio.ensure_future(fetcher())] = name
+                timeout = self.hedge_delay if queued else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        pdf_url, error = task.result()
+                    except Exception as e:
+                        pdf_url, error = None, f"异常: {str(e)}"
+                    if pdf_url:
+                        return name, pdf_url, None
+                    last_error = error
+            return None, None, last_error
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _adownload_from_sources(self, http, title: str, save_path: str, retries=3) -> dict:
+        result = {
+            'title': title,
+            'status': '失败',
+            'method': None,
+            'error': None,
+            'save_path': save_path
+        }
+
+        logging.info(f"🔍 开始处理: {title}")
+        source_classes = []
+
+        sources = [
+            ('Sci-Hub (DOI)', lambda: self._atry_doi_fetch(http, title)),
+            ('arXiv', lambda: self._afetch_arxiv(http, title)),
+            ('Sci-Hub (Selenium)', lambda: self._afetch_scihub_selenium(title)),
+        ]
+
+        if self.hedge_delay is not None:
+            source_name, pdf_url, error = await self._ahedged_fetch(sources)
+            if pdf_url and self.store is not None and (linked := await self._run_io(
+                    self._link_from_store, title, await self._run_io(self._cached_doi, title), save_path)):
+                return linked
+            if pdf_url:
+                logging.info(f"⬇️ 尝试下载: {pdf_url}")
+                success, error = await self._adownload_pdf(http, pdf_url, save_path)
+                if success:
+                    result.update({'status': '成功', 'method': source_name, 'error': None})
+                    logging.info(f"✅ 下载成功: {title} via {source_name}")
+                    return result
+            result['error'] = error
+
+        for source_name, fetcher in sources:
+            for attempt in range(retries):
+                try:
+                    pdf_url, error = await fetcher()
+                    if not pdf_url:
+                        result['error'] = error
+                        logging.warning(f"❓ {source_name} 未找到资源: {error}")
+                    else:
+                        logging.info(f"⬇️ 尝试下载: {pdf_url}")
+                        success, dl_error = await self._adownload_pdf(http, pdf_url, save_path)
+                        if success:
+                            result.update({
+                                'status': '成功',
+                                'method': source_name,
+                                'error': None
+                            })
+                            logging.info(f"✅ 下载成功: {title} via {source_name}")
+                            return result
+
+                        result['error'] = dl_error
+                        logging.warning(f"⚠️ 下载失败: {dl_error}")
+
+                except Exception as e:
+                    error_msg = f"异常: {str(e)}"
+                    result['error'] = error_msg
+                    logging.error(f"🔥 发生异常: {error_msg}")
+
+                delay = retry_delay(result['error'], attempt)
+                if delay is None:
+                    break
+                if attempt + 1 < retries:
+                    self.metrics.inc('retries_total', source=source_name)
+                    with self.metrics.timer('sleep', source_name):
+                        await asyncio.sleep(delay)
+            source_classes.append(classify_error(result['error']))
+
+        result['error_class'] = worst_error_class(source_classes)
+        if result['status'] == '失败':
+            logging.error(f"❌ 最终失败: {title} | 错误: {result.get('error', '未知错误')}")
+        return result
+
+    async def download_papers_async(self, titles: List[str], save_dir: str) -> Dict[str, int]:
+        """在单个事件循环中并发下载，结果字典与CSV格式与线程池模式一致"""
+        if aiohttp is None:
+            raise RuntimeError("异步引擎需要安装aiohttp: pip install aiohttp")
+
+        os.makedirs(save_dir, exist_ok=True)
+        self.store = PdfStore(save_dir, self.store_manifest) if self.use_store else None
+        self._store_locks = {}  # 键 -> [asyncio.Lock, 引用数]
+        self.scheduler.reset_async()
+        stats = {'success': 0, 'fail': 0, 'skipped': 0}
+        result_file, result_writer = self._open_result_csv(self.result_csv, append=self._append_results)
+        self._io_pool = ThreadPoolExecutor(max_workers=self.per_host_limit * 2, thread_name_prefix='aio-io')
+
+        title_slots = asyncio.Semaphore(self.max_concurrency)
+        self._selenium_slots = asyncio.Semaphore(2)
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.per_host_limit)
+
+        async def worker(http, title, save_path):
+            async with title_slots:
+                return await self.adownload_by_title(http, title, save_path)
+
+        tasks = []
+        try:
+            with tqdm(
+                    total=len(titles),
+                    desc="📥 论文下载进度",
+                    unit="篇",
+                    bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [已用:{elapsed}<剩余:{remaining}]"
+            ) as pbar:
+                async with aiohttp.ClientSession(headers=self.headers, connector=connector) as http:
+                    for title in titles:
+                        save_path = self._save_path_for(title, save_dir)
+                        if await self._run_io(self._adopt_existing, title, save_path):
+                            await self._run_io(self._record, result_writer, self._skipped_result(title, save_path))
+                            stats['skipped'] += 1
+                            pbar.update(1)
+                            pbar.set_postfix(stats, refresh=True)
+                            continue
+                        tasks.append(asyncio.create_task(worker(http, title, save_path)))
+
+                    for task in asyncio.as_completed(tasks):
+                        try:
+                            result = await task
+                            if result['status'] == '成功':
+                                stats['success'] += 1
+                            else:
+                                stats['fail'] += 1
+                            await self._run_io(self._record, result_writer, result)
+                            await self._run_io(result_file.flush)
+                        except Exception as e:
+                            logging.error(f"处理任务结果时出错: {str(e)}")
+                            stats['fail'] += 1
+
+                        pbar.update(1)
+                        pbar.set_postfix(stats, refresh=True)
+        finally:
+            # 出错或被取消时不留下仍在运行的任务，并关闭结果文件与I/O线程池
+            for task in tasks:
+                task.cancel()
+            result_file.close()
+            self._io_pool.shutdown(wait=True)
+            self._io_pool = None
+        return stats
+
+
+def iter_titles_from_csv(file_path: str) -> Iterator[str]:
+    """逐行读取CSV中的论文标题，不把整个文件读入内存"""
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if title := (row.get('Title') or '').strip():
+                yield title
+
 
 def read_titles_from_csv(file_path: str) -> List[str]:
     """从CSV文件读取论文标题"""
     titles = []
     try:
-        with open(file_path, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            titles = [row.get('Title', '').strip() for row in reader if row.get('Title', '').strip()]
+        titles = list(iter_titles_from_csv(file_path))
         logging.info(f"成功读取 {len(titles)} 篇论文标题")
     except Exception as e:
         logging.critical(f"💥 无法读取输入文件: {str(e)}")
     return titles
 
 
-def main(input_csv, save_dir, max_workers):
+# ---------------- 分片运行 ----------------
+# 每个分片是一个独立进程（可在不同机器上运行），按标题哈希分配标题，使用各自的结果/缓存/日志文件，
+# 结束后用 merge 命令合并；PDF保存目录可以共用。
+# 本地库的清单同样按分片区分（每个SQLite文件只被一台机器上的一个进程打开），分片之间只共用按内容哈希命名的
+# objects 目录；同一标题总在同一分片，不同标题对应同一DOI时可能被两个分片各下载一次，内容相同只保留一份。
+# 保存目录位于网络文件系统时SQLite的文件锁不可靠，应使用本地目录或以 --no-store 关闭本地库
+
+# PaperDownloader 中需要按分片区分的文件参数及默认路径
+SHARD_FILES = {
+    'cache_file': 'request_cache.db',
+    'journal_file': 'run_journal.db',
+    'result_csv': 'download_results.csv',
+    'manifest_file': 'resolve_manifest.jsonl',
+    'metrics_file': 'run_metrics.json',
+    'prometheus_file': 'run_metrics.prom',
+    'store_manifest': 'manifest.db',  # 相对于 save_dir/.store
+}
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """解析 "i/N"（i 从0开始）"""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', text or '')
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"分片格式应为 i/N 且 0 <= i < N: {text}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def in_shard(title: str, shard: Tuple[int, int]) -> bool:
+    """按归一化标题的哈希分片：结果与进程、机器无关，同一标题的不同写法总在同一分片"""
+    index, count = shard
+    return int(hashlib.md5(title_key(title).encode('utf-8')).hexdigest()[:8], 16) % count == index
+
+
+def shard_path(path: str, shard: Optional[Tuple[int, int]]) -> str:
+    """download_results.csv -> download_results.shard-0-of-4.csv"""
+    if not shard:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def shard_files(path: str, count: Optional[int] = None) -> List[str]:
+    """找到某个文件的全部分片，count 为None时自动发现"""
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r'\.shard-(\d+)-of-(\d+)' + re.escape(ext) + '$')
+    found = []
+    for name in os.listdir(os.path.dirname(path) or '.'):
+        if (match := pattern.match(name)) and (count is None or int(match.group(2)) == count):
+            found.append((int(match.group(2)), int(match.group(1)), os.path.join(os.path.dirname(path), name)))
+    return [file for _, _, file in sorted(found)]
+
+
+def merge_shards(count: Optional[int] = None, result_csv='download_results.csv',
+                 cache_file='request_cache.db', journal_file='run_journal.db', save_dir=None) -> Dict[str, int]:
+    """把各分片的结果CSV、缓存和运行日志合并到不带后缀的文件中；给出 save_dir 时同时合并本地库清单"""
+    merged = {'results': 0, 'cache': 0, 'journal': 0, 'store': 0}
+
+    result_shards = shard_files(result_csv, count)
+    if result_shards:
+        with open(result_csv, 'w', newline='', encoding='utf-8-sig') as out:
+            writer = None
+            for path in result_shards:
+                with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+                    reader = csv.DictReader(f)
+                    if writer is None:
+                        writer = csv.DictWriter(out, fieldnames=reader.fieldnames)
+                        writer.writeheader()
+                    for row in reader:
+                        writer.writerow(row)
+                        merged['results'] += 1
+
+    cache = RequestCache(cache_file)
+    try:
+        for path in shard_files(cache_file, count):
+            merged['cache'] += cache.merge_from(path)
+    finally:
+        cache.close()
+
+    journal = RunJournal(journal_file)
+    try:
+        for path in shard_files(journal_file, count):
+            merged['journal'] += journal.merge_from(path)
+    finally:
+        journal.close()
+
+    if save_dir is not None and os.path.isdir(os.path.join(save_dir, '.store')):
+        store = PdfStore(save_dir, SHARD_FILES['store_manifest'])
+        try:
+            for path in shard_files(store.db_file, count):
+                merged['store'] += store.merge_from(path)
+        finally:
+            store.close()
+
+    merged['shards'] = len(result_shards)
+    return merged
+
+
+def main(input_csv, save_dir, max_workers, engine='thread', resume=False, shard=None, use_store=True):
+    """shard=(i, N) 时只处理按标题哈希分到第 i 片的标题，结果、缓存、日志、本地库清单等文件都带分片后缀"""
     # 设置日志
-    setup_logging()
+    setup_logging(shard_path('paper_downloader.jsonl', shard))
 
     # 初始化下载器，设置并行数
-    downloader = PaperDownloader(max_workers=max_workers)  # 调整线程数量
+    downloader = PaperDownloader(
+        max_workers=max_workers,  # 调整线程数量
+        use_store=use_store,
+        **{name: shard_path(path, shard) for name, path in SHARD_FILES.items()}
+    )
+
+    if engine == 'stream':
+        # 流式模式边读边下载，不预先读入全部标题，也不做批量预解析
+        if not os.path.exists(input_csv):
+            logging.critical(f"💥 无法读取输入文件: {input_csv}")
+            return
+        titles = iter_titles_from_csv(input_csv)
+        if shard:
+            titles = (title for title in titles if in_shard(title, shard))
+    else:
+        # 读取输入文件
+        titles = read_titles_from_csv(input_csv)
+        if shard:
+            titles = [title for title in titles if in_shard(title, shard)]
+            logging.info(f"分片 {shard[0]}/{shard[1]}: {len(titles)} 篇")
+        if not titles:
+            logging.error("没有找到要下载的论文标题!")
+            return
+
+        # 续跑时已完成的标题与已存在的文件不需要再解析
+        pending = titles
+        if resume and os.path.exists(downloader.journal_file):
+            journal = RunJournal(downloader.journal_file)
+            finished = journal.finished_titles()
+            journal.close()
+            pending = [title for title in titles if title not in finished]
+        pending = [
+        title for title in pending
+        if not any(path and os.path.exists(path) for path in (downloader._save_path_for(title, save_dir),
+                                                              downloader._legacy_save_path_for(title, save_dir)))
+    ]
 
-    # 读取输入文件
-    titles = read_titles_from_csv(input_csv)
-    if not titles:
-        logging.error("没有找到要下载的论文标题!")
-        return
+        # 预先批量解析DOI，下载阶段直接命中缓存
+        doi_map = downloader.resolve_dois(pending)
+        # 没有DOI的标题再批量检索arXiv
+        downloader.resolve_arxiv([title for title in pending if not doi_map.get(title)])
 
     # 执行下载
-    stats = downloader.download_papers(titles, save_dir)
+    stats = downloader.download_papers(titles, save_dir, engine=engine, resume=resume)
+    downloader.cache.close()
 
     # 最终输出
-    print(f"\n✅ 下载完成！成功: {stats['success']} 篇 | 失败: {stats['fail']} 篇 | 跳过: {stats['skipped']} 篇")
+    print(f"\n✅ 下载完成！成功: {stats['success']} 篇 | 失败: {stats['fail']} 篇 | 跳过: {stats['skipped']} 篇 | "
+          f"重复: {stats.get('duplicates', 0)} 篇")
     logging.info(f"最终统计 - {stats}")
     logging.info("🏁 程序运行结束")
 
 
+def compact_cache(cache_file='request_cache.db'):
+    """清理过期/超量缓存并压缩数据库文件"""
+    cache = RequestCache(cache_file)
+    result = cache.compact()
+    cache.close()
+    print(f"🧹 缓存压缩完成！删除: {result['removed']} 条 | 剩余: {result['remaining']} 条")
+
+
+def cli(argv=None):
+    """命令行入口
+
+    python auto_dwn.py [download] [输入CSV] [保存目录] [--workers 5] [--engine thread] [--resume] [--stream] [--shard i/N]
+                       [--no-store]
+    python auto_dwn.py merge [--shards N] [--save-dir 保存目录]
+    python auto_dwn.py compact-cache [缓存文件]
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in ('download', 'merge', 'compact-cache', '-h', '--help'):
+        argv.insert(0, 'download')  # 不写子命令时默认为下载
+
+    parser = argparse.ArgumentParser(prog='auto_dwn.py', description="学术论文自动下载器")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    download = commands.add_parser('download', help="下载论文（默认命令）")
+    download.add_argument('input_csv', nargs='?', default='wos_results.csv', help="输入CSV文件路径")
+    download.add_argument('save_dir', nargs='?', default='your_save_dir', help="论文保存目录")
+    download.add_argument('--workers', type=int, default=5, help="并行下载线程数")
+    download.add_argument('--engine', default='thread', choices=['thread', 'async', 'pipeline', 'stream'])
+    download.add_argument('--stream', action='store_true', help="等同于 --engine stream")
+    download.add_argument('--resume', action='store_true', help="根据运行日志续跑")
+    download.add_argument('--shard', type=parse_shard, help="只处理第 i 片（共 N 片，i 从0开始），如 0/4")
+    download.add_argument('--no-store', action='store_true',
+                          help="关闭按DOI/内容哈希去重的本地库（保存目录在网络文件系统上时使用）")
+
+    merge = commands.add_parser('merge', help="合并各分片的结果CSV、缓存和运行日志")
+    merge.add_argument('--shards', type=int, help="分片总数，不填时自动发现")
+    merge.add_argument('--save-dir', help="各分片共用的保存目录，给出时同时合并本地库清单")
+
+    compact = commands.add_parser('compact-cache', help="清理过期缓存并压缩缓存文件")
+    compact.add_argument('cache_file', nargs='?', default='request_cache.db')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compact-cache':
+        compact_cache(args.cache_file)
+    elif args.command == 'merge':
+        merged = merge_shards(args.shards, save_dir=args.save_dir)
+        print(f"🧩 合并完成！分片: {merged['shards']} 个 | 结果: {merged['results']} 行 | "
+              f"缓存: {merged['cache']} 条 | 运行日志: {merged['journal']} 条 | 本地库: {merged['store']} 条")
+    else:
+        main(args.input_csv, args.save_dir, args.workers, engine='stream' if args.stream else args.engine,
+             resume=args.resume, shard=args.shard, use_store=not args.no_store)
+
+
 if __name__ == "__main__":
-    input_csv = 'wos_results.csv'
-    save_dir = 'your_save_dir'
-    main(input_csv, save_dir, 5)
+    cli()
@@ -0,0 +1,468 @@
+"""auto_dwn.py 吞吐量基准测试
+
+在子进程中启动 CrossRef works API、arXiv Atom API 和 PDF 主机（兼作Sci-Hub镜像页面）的本地替身服务，
+可配置延迟、错误率、429比例和文件大小；用 PaperDownloader.download_papers 下载一批合成标题，
+报告 篇/秒、字节/秒、单篇耗时 p50/p99 和峰值内存，不访问任何真实服务。
+
+python bench_dwn.py --titles 200 --workers 5,10,20 --latency 0.05 --error-rate 0.02 --rate-limit 0.01
+"""
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+
+try:
+    import resource  # Windows 上不可用
+except ImportError:
+    resource = None
+
+import auto_dwn
+
+
+# ---------------- 本地替身服务 ----------------
+
+def _title_hash(text: str) -> str:
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _hit(text: str, rate: float) -> bool:
+    """按标题哈希确定性地决定是否命中，保证同一标题多次查询结果一致"""
+    return int(_title_hash(text)[:8], 16) / 0xFFFFFFFF < rate
+
+
+def make_pdf(size: int) -> bytes:
+    """生成约 size 字节、结构完整（单页、xref表、%%EOF）的PDF，用内容流中的注释填充体积"""
+    padding = b'%' + b'0' * max(0, size - 420) + b'\n'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R >>',
+        b'<< /Length %d >>\nstream\n' % len(padding) + padding + b'endstream',
+    ]
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    service = None  # 'crossref' / 'arxiv' / 'pdf'
+    config = {}
+    counters = None
+    lock = None
+    pdf_bodies = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def _send(self, code: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self._count('bytes_sent', len(body))
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/_stats':
+            with self.lock:
+                body = json.dumps(dict(self.counters)).encode()
+            self._send(200, body, 'application/json')
+            return
+
+        self._count(f'{self.service}_requests')
+        latency = self.config['latency']
+        if latency > 0:
+            time.sleep(max(0.0, random.gauss(latency, latency * self.config['jitter'])))
+
+        roll = random.random()
+        if roll < self.config['rate_limit']:
+            self._count('rate_limited')
+            self._send(429, b'Too Many Requests', 'text/plain',
+                       {'Retry-After': str(self.config['retry_after'])})
+            return
+        if roll < self.config['rate_limit'] + self.config['error_rate']:
+            self._count('errors')
+            self._send(500, b'Internal Server Error', 'text/plain')
+            return
+
+        query = urllib.parse.parse_qs(url.query)
+        if self.service == 'crossref' and url.path == '/works':
+            self._crossref(query.get('query.title', [''])[0])
+        elif self.service == 'arxiv' and url.path == '/api/query':
+            self._arxiv(query.get('search_query', [''])[0])
+        elif self.service == 'pdf' and '/pdf/' in url.path:
+            # Sci-Hub页面里的相对链接会拼在镜像路径后面，因此匹配任意包含 /pdf/ 的路径
+            self._pdf()
+        elif self.service == 'pdf' and url.path.startswith('/scihub/'):
+            doi = urllib.parse.unquote(url.path[len('/scihub/'):]).strip('/')
+            name = re.sub(r'[^\w.-]', '_', doi)
+            body = f'<html><button id="save" onclick="location.href=\'/pdf/{name}.pdf\'">save</button></html>'
+            self._send(200, body.encode(), 'text/html')
+        else:
+            self._send(404, b'Not Found', 'text/plain')
+
+    def _crossref(self, title: str):
+        items = []
+        if not _hit(auto_dwn.normalize_title(title), self.config['crossref_miss_rate']):
+            items.append({'DOI': f'10.5555/{_title_hash(title)[:12]}'})
+        body = json.dumps({'status': 'ok', 'message': {'items': items}}).encode()
+        self._send(200, body, 'application/json')
+
+    def _arxiv(self, search_query: str):
+        # 兼容逐条检索 ti:xxx 与批量检索 ti:"a" OR ti:"b"
+        titles = re.findall(r'ti:"([^"]*)"', search_query)
+        if not titles and search_query.startswith('ti:'):
+            titles = [search_query[3:]]
+        base = self.config['pdf_base']
+        entries = []
+        for title in titles:
+            if _hit(title, self.config['arxiv_hit_rate']):
+                arxiv_id = _title_hash(title)[:10]
+                entries.append(
+                    f'<entry><id>{base}/abs/{arxiv_id}</id><title>{html.escape(title)}</title>'
+                    f'<link title="pdf" href="{base}/pdf/{arxiv_id}.pdf" rel="related" type="application/pdf"/>'
+                    f'</entry>'
+                )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">'
+            f'<opensearch:totalResults>{len(entries)}</opensearch:totalResults>'
+            + ''.join(entries) + '</feed>'
+        ).encode()
+        self._send(200, body, 'application/atom+xml')
+
+    def _pdf(self):
+        size = self.config['pdf_size']
+        body = self.pdf_bodies.get(size)
+        if body is None:
+            body = self.pdf_bodies[size] = make_pdf(size)
+        self._count('pdf_downloads')
+        if random.random() < self.config['corrupt_rate']:
+            # 截断的文件：开头仍是 %PDF，长度与Content-Length一致，只有结构校验能发现
+            self._count('corrupt_served')
+            body = body[:len(body) // 2]
+
+        headers = {'ETag': f'"{len(body)}"', 'Accept-Ranges': 'bytes'}
+        if (range_header := self.headers.get('Range')) and (match := re.match(r'bytes=(\d+)-', range_header)):
+            start = int(match.group(1))
+            headers['Content-Range'] = f'bytes {start}-{len(body) - 1}/{len(body)}'
+            self._send(206, body[start:], 'application/pdf', headers)
+        else:
+            self._send(200, body, 'application/pdf', headers)
+
+
+def _serve(config: dict, conn):
+    """子进程入口：启动三个替身服务并把地址回传给父进程"""
+    counters, lock = {}, threading.Lock()
+    urls = {}
+    for service in ('crossref', 'arxiv', 'pdf'):
+        handler = type(f'{service.title()}Handler', (StandInHandler,), {
+            'service': service, 'config': config, 'counters': counters, 'lock': lock
+        })
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls[service] = f'http://127.0.0.1:{server.server_address[1]}'
+    config['pdf_base'] = urls['pdf']  # arXiv条目的PDF链接指向PDF主机
+    conn.send(urls)
+    conn.recv()  # 阻塞直到父进程通知退出
+
+
+class StandInServices:
+    """在独立子进程中运行替身服务，避免服务端占用被测进程的GIL和内存"""
+
+    DEFAULTS = {
+        'latency': 0.05,  # 每个请求的平均延迟（秒）
+        'jitter': 0.3,  # 延迟的相对标准差
+        'error_rate': 0.0,  # 返回500的比例
+        'rate_limit': 0.0,  # 返回429的比例
+        'retry_after': 1,  # 429响应的Retry-After秒数
+        'pdf_size': 512 * 1024,  # PDF文件大小（字节）
+        'corrupt_rate': 0.0,  # 返回截断PDF的比例
+        'crossref_miss_rate': 0.1,  # CrossRef查不到DOI的标题比例
+        'arxiv_hit_rate': 0.5,  # arXiv能找到的标题比例
+    }
+
+    def __init__(self, **config):
+        self.config = {**self.DEFAULTS, **config}
+        self.urls = {}
+        self._process = None
+        self._conn = None
+
+    def __enter__(self):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.config, child), daemon=True)
+        self._process.start()
+        self.urls = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+
+    def stats(self) -> Dict[str, int]:
+        with urllib.request.urlopen(self.urls['pdf'] + '/_stats', timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def attach(self, downloader: auto_dwn.PaperDownloader, rate=1000.0, arxiv_rate=None):
+        """把下载器的CrossRef/arXiv/Sci-Hub地址指向替身服务，并禁用Selenium兜底"""
+        downloader.crossref_api = self.urls['crossref'] + '/works?query.title={}&rows=1&select=DOI'
+        downloader.arxiv_api = self.urls['arxiv'] + '/api/query'
+        downloader.scihub_urls = [self.urls['pdf'] + '/scihub']
+        downloader.active_mirrors = []
+        downloader.scheduler = auto_dwn.HostScheduler(default_rate=rate, default_burst=rate,
+                                                      default_max_in_flight=downloader.per_host_limit)
+        downloader.scheduler.metrics = downloader.metrics
+        if arxiv_rate is not None:
+            downloader.scheduler.configure(auto_dwn.HostScheduler.host_of(downloader.arxiv_api),
+                                           rate=arxiv_rate, burst=1, max_in_flight=1)
+        downloader._fetch_scihub_selenium = lambda title: (None, "镜像中未找到PDF链接")
+        # 真实arXiv链接会被改写为https，替身服务只提供http
+        arxiv_pdf_link = downloader._arxiv_pdf_link
+        downloader._arxiv_pdf_link = lambda entry: (
+            (url := arxiv_pdf_link(entry)) and url.replace('https:', 'http:', 1)
+        )
+
+
+# ---------------- 基准测试 ----------------
+
+def _peak_rss() -> Optional[int]:
+    """当前进程的峰值常驻内存（字节），无法获取时返回None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _track_latency(downloader: auto_dwn.PaperDownloader) -> List[float]:
+    """给下载器装上计时钩子：从标题开始处理到写出结果行的耗时（不含排队时间）"""
+    starts, latencies = {}, []
+
+    def start(title):
+        starts.setdefault(title, time.perf_counter())
+
+    download_by_title = downloader.download_by_title
+    adownload_by_title = downloader.adownload_by_title
+    resolve_item = downloader._resolve_item
+    record = downloader._record
+
+    def timed_download(title, *args, **kwargs):
+        start(title)
+        return download_by_title(title, *args, **kwargs)
+
+    async def timed_adownload(http, title, *args, **kwargs):
+        start(title)
+        return await adownload_by_title(http, title, *args, **kwargs)
+
+    def timed_resolve(item, *args, **kwargs):
+        start(item['title'])
+        return resolve_item(item, *args, **kwargs)
+
+    def timed_record(result_writer, result):
+        if (began := starts.pop(result['title'], None)) is not None:
+            latencies.append(time.perf_counter() - began)
+        return record(result_writer, result)
+
+    downloader.download_by_title = timed_download
+    downloader.adownload_by_title = timed_adownload
+    downloader._resolve_item = timed_resolve
+    downloader._record = timed_record
+    return latencies
+
+
+def synthetic_titles(count: int, seed=0) -> List[str]:
+    rng = random.Random(seed)
+    topics = ['graph neural networks', 'protein folding', 'battery materials', 'sparse attention',
+              'quantum error correction', 'climate downscaling', 'federated learning', 'catalyst design']
+    return [
+        f"{rng.choice(topics).title()} study {i}: {rng.choice(['a survey', 'new methods', 'benchmarks'])}"
+        for i in range(count)
+    ]
+
+
+def run_benchmark(titles: List[str], services: StandInServices, engine='thread', max_workers=5,
+                  rate=1000.0, arxiv_rate=None, pre_resolve=False, **downloader_kwargs) -> dict:
+    """在临时目录中跑一次 download_papers，返回吞吐量/延迟/内存报告"""
+    workdir = tempfile.mkdtemp(prefix='bench_dwn_')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # 结果CSV和解析清单写在当前目录
+    try:
+        downloader = auto_dwn.PaperDownloader(
+            max_workers=max_workers,
+            cache_file=os.path.join(workdir, 'request_cache.db'),
+            journal_file=os.path.join(workdir, 'run_journal.db'),
+            **downloader_kwargs
+        )
+        services.attach(downloader, rate=rate, arxiv_rate=arxiv_rate)
+        latencies = _track_latency(downloader)
+        before = services.stats()
+
+        began = time.perf_counter()
+        if pre_resolve:
+            doi_map = downloader.resolve_dois(titles)
+            downloader.resolve_arxiv([title for title in titles if not doi_map.get(title)])
+        stats = downloader.download_papers(titles, os.path.join(workdir, 'papers'), engine=engine)
+        elapsed = time.perf_counter() - began
+        downloader.cache.close()
+
+        after = services.stats()
+        server = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+        transferred = server.get('bytes_sent', 0)
+        peak_rss = _peak_rss()
+        return {
+            'engine': engine,
+            'max_workers': max_workers,
+            'titles': len(titles),
+            'elapsed': round(elapsed, 3),
+            'titles_per_sec': round(len(titles) / elapsed, 2) if elapsed else None,
+            'bytes': transferred,
+            'bytes_per_sec': round(transferred / elapsed) if elapsed else None,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p99': _percentile(latencies, 99),
+            'peak_rss': peak_rss,
+            'worker_utilization': downloader.metrics.utilization(),
+            'cache_hit_rate': downloader.metrics.cache_hit_rate(),
+            'stats': stats,
+            'server': server,
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _isolated_child(conn, titles, config, urls, kwargs):
+    services = StandInServices(**config)
+    services.urls = urls  # 复用父进程已启动的替身服务
+    try:
+        conn.send(('ok', run_benchmark(titles, services, **kwargs)))
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_isolated(titles: List[str], services: StandInServices, **kwargs) -> dict:
+    """在全新的子进程中运行 run_benchmark：峰值内存取自进程级的 ru_maxrss，
+    同一进程里依次测试多组配置时后面的结果会包含前面的峰值，因此每组配置各用一个进程"""
+    context = multiprocessing.get_context('spawn')
+    conn, child = context.Pipe(duplex=False)
+    process = context.Process(target=_isolated_child, args=(child, titles, services.config, services.urls, kwargs))
+    process.start()
+    child.close()
+    try:
+        status, payload = conn.recv()
+    except EOFError:
+        status, payload = 'error', f"子进程异常退出，退出码 {process.exitcode}"
+    finally:
+        process.join()
+    if status != 'ok':
+        raise RuntimeError(f"基准测试子进程失败: {payload}")
+    return payload
+
+
+def print_report(report: dict):
+    def fmt_seconds(value):
+        return f"{value * 1000:.0f}ms" if value is not None else "-"
+
+    rss = f"{report['peak_rss'] / 2 ** 20:.1f}MB" if report['peak_rss'] else "-"
+    print(
+        f"engine={report['engine']} workers={report['max_workers']} | "
+        f"{report['titles']} 篇 / {report['elapsed']:.2f}s | "
+        f"{report['titles_per_sec']} 篇/秒 | {report['bytes_per_sec'] / 2 ** 20:.2f} MB/秒 | "
+        f"p50 {fmt_seconds(report['latency_p50'])} p99 {fmt_seconds(report['latency_p99'])} | "
+        f"峰值内存 {rss} | 利用率 {report['worker_utilization']}"
+    )
+    print(f"  结果: {report['stats']} | 服务端: {report['server']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="auto_dwn.py 离线吞吐量基准测试")
+    parser.add_argument('--titles', type=int, default=200, help="合成标题数量")
+    parser.add_argument('--engine', default='thread', choices=['thread', 'async', 'pipeline', 'stream'])
+    parser.add_argument('--workers', default='5', help="并发线程数，逗号分隔可依次测试多组，如 5,10,20")
+    parser.add_argument('--latency', type=float, default=0.05, help="替身服务平均延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回500的比例")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="返回429的比例")
+    parser.add_argument('--retry-after', type=int, default=1, help="429响应的Retry-After秒数")
+    parser.add_argument('--pdf-size', type=int, default=512 * 1024, help="PDF大小（字节）")
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help="返回截断PDF的比例")
+    parser.add_argument('--crossref-miss-rate', type=float, default=0.1)
+    parser.add_argument('--arxiv-hit-rate', type=float, default=0.5)
+    parser.add_argument('--rate', type=float, default=1000.0, help="每个主机的调度速率（请求/秒）")
+    parser.add_argument('--arxiv-rate', type=float, default=None,
+                        help="arXiv主机速率，默认与 --rate 相同（真实环境为1/3）")
+    parser.add_argument('--pre-resolve', action='store_true', help="先批量解析DOI/arXiv，与 auto_dwn.main 一致")
+    parser.add_argument('--hedge-delay', type=float, default=None)
+    parser.add_argument('--json', help="把报告写入JSON文件，便于比较不同版本")
+    parser.add_argument('--same-process', action='store_true',
+                        help="所有配置在当前进程中依次运行（启动更快，但峰值内存是累计值）")
+    args = parser.parse_args(argv)
+
+    titles = synthetic_titles(args.titles)
+    reports = []
+    with StandInServices(latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                         retry_after=args.retry_after, pdf_size=args.pdf_size, corrupt_rate=args.corrupt_rate,
+                         crossref_miss_rate=args.crossref_miss_rate,
+                         arxiv_hit_rate=args.arxiv_hit_rate) as services:
+        run = run_benchmark if args.same_process else run_isolated
+        for workers in [int(value) for value in args.workers.split(',') if value.strip()]:
+            report = run(titles, services, engine=args.engine, max_workers=workers,
+                         rate=args.rate, arxiv_rate=args.arxiv_rate,
+                         pre_resolve=args.pre_resolve, hedge_delay=args.hedge_delay)
+            print_report(report)
+            reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    main()